@@ -3,6 +3,7 @@ from django.contrib import admin
 from App import models
 
 admin.site.register(models.BookmarkFile)
+admin.site.register(models.BookmarkFileUpload)
 admin.site.register(models.Bookmark)
 admin.site.register(models.ScrapyResponseLog)
 admin.site.register(models.BookmarkWebpage)
@@ -1,2 +1,5 @@
 from .bookmark_file_managers import *
+from .bookmarks_buffer import *
+from .bookmarks_manifest import *
+from .crawl_frontier import *
 from .text_cleaner import *
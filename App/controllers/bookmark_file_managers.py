@@ -1,11 +1,15 @@
-import json
 import re
 from abc import ABC, abstractmethod
+from typing import Generator
 
 import validators
 from bs4 import BeautifulSoup
 from django.core.exceptions import ValidationError
 from django.db.models.fields.files import FieldFile
+from lxml import etree
+
+from common.utils.array_utils import window_iter
+from common.utils.file_utils import DecompressedFile, iter_json_array, upload_attr
 
 
 class BookmarkFileManager(ABC):
@@ -25,12 +29,103 @@ class BookmarkFileManager(ABC):
     def validate(self) -> bool:
         pass
 
+    def read_head(self, length: int) -> bytes:
+        """First bytes of the file, a fresh upload already has them
+        from the upload handler so the file is not read again"""
+        head = upload_attr(self.file, "head")
+        if head is not None:
+            return head[:length]
+
+        self.file.seek(0)
+        return self.file.read(length)
+
+    def within_size_limit(self) -> bool:
+        """Decompress a compressed file to its end once before it is parsed,
+        so an oversized (or corrupted) archive fails validation and not
+        after part of its links are stored"""
+        if not isinstance(self.file, DecompressedFile):
+            return True
+
+        self.file.seek(0)
+        try:
+            for _ in iter(lambda: self.file.read(self.CHUNK_SIZE), b""):
+                pass
+        except ValueError as e:
+            raise ValidationError(str(e)) from e
+
+        return True
+
     @abstractmethod
-    def get_links(self) -> list[dict]:
+    def iter_links(self) -> Generator[dict, None, None]:
         pass
 
+    def get_links(self) -> list[dict]:
+        return list(self.iter_links())
+
+
+class NetscapeBookmarksTarget:
+    """lxml parser target that collects `<A>` elements of a netscape
+    bookmarks file without building a tree, keeping the `<H3>` folders path
+    ```
+    <DT><H3>Folder</H3>
+    <DL><p>
+        <DT><A HREF="https://..." ADD_DATE="...">Title</A>
+    </DL><p>
+    ```
+    """
+
+    def __init__(self) -> None:
+        self.links = []
+        self.folders = []  # stack of folder names (None for unnamed lists)
+
+        self._pending_folder = None
+        self._folder_text = None
+        self._link = None
+        self._link_text = None
+
+    def start(self, tag, attrib):
+        if tag == "a" and "href" in attrib:
+            self._link = dict(attrib)
+            self._link_text = []
+        elif tag == "h3":
+            self._folder_text = []
+        elif tag == "dl":
+            self.folders.append(self._pending_folder)
+            self._pending_folder = None
+
+    def end(self, tag):
+        if tag == "a" and self._link is not None:
+            attrs = self._link
+            attrs["url"] = attrs.pop("href")
+            attrs["title"] = "".join(self._link_text)
+            attrs["added_at"] = attrs.pop("add_date", None)
+            attrs["folders"] = [f for f in self.folders if f is not None]
+
+            self.links.append(attrs)
+            self._link = self._link_text = None
+        elif tag == "h3" and self._folder_text is not None:
+            self._pending_folder = "".join(self._folder_text).strip()
+            self._folder_text = None
+        elif tag == "dl" and self.folders:
+            self.folders.pop()
+
+    def data(self, data):
+        if self._link_text is not None:
+            self._link_text.append(data)
+        elif self._folder_text is not None:
+            self._folder_text.append(data)
+
+    def close(self):
+        return None
+
+    def pop_links(self) -> list[dict]:
+        links, self.links = self.links, []
+        return links
+
 
 class BookmarkHTMLFileManager(BookmarkFileManager):
+    CHUNK_SIZE = 64 * 1024  # bytes fed to the parser at once
+
     def __init__(self, file_field: FieldFile):
         self.file = file_field
 
@@ -52,51 +147,101 @@ class BookmarkHTMLFileManager(BookmarkFileManager):
         def contain_links():
             regex = r"<a\s+?href=[\"\']http[s]{0,1}://.+?[\"\']"
             regex = re.compile(regex, re.IGNORECASE)
-            match = re.search(regex, self.get_src(3000))
+            src = self.read_head(3000).decode("utf8", errors="ignore")
+            match = re.search(regex, src)
             return bool(match)
 
-        checks = [contain_links]
+        checks = [contain_links, self.within_size_limit]
         if self._is_valid is None:
             self._is_valid = all(check() for check in checks)
 
         return self.is_valid
 
-    def get_links(self):
+    def iter_chunks(self):
+        self.file.seek(0)
+        try:
+            yield from iter(lambda: self.file.read(self.CHUNK_SIZE), b"")
+        except ValueError as e:
+            raise ValidationError(str(e)) from e
+
+    def iter_links(self):
+        """Stream the file into lxml parser and yield links one by one
+        so memory stays constant whatever the file size is"""
         self.validate()
 
-        links = []
-        for item in self.soup.select("a"):
-            attrs = item.attrs.copy()
+        target = NetscapeBookmarksTarget()
+        parser = etree.HTMLParser(target=target, encoding="utf8")
 
-            attrs["url"] = attrs.pop("href")
-            attrs["title"] = item.text
-            attrs["added_at"] = attrs.pop("add_date", None)
+        for chunk in self.iter_chunks():
+            parser.feed(chunk)
+            yield from target.pop_links()
 
-            links.append(attrs)
-        return links
+        parser.close()
+        yield from target.pop_links()
 
 
 class BookmarkJSONFileManager(BookmarkFileManager):
+    CHUNK_SIZE = 64 * 1024  # bytes read from the file at once
+    VALIDATION_CHUNK_SIZE = 500  # items validated at once
+
+    # Cheap check that accepts the common urls, anything else
+    # falls back to the slower `validators.url`
+    URL_REGEX = re.compile(
+        r"https?://"
+        r"(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,63}"
+        r"(?::\d{1,5})?"
+        r"(?:[/?#][^\s\x00-\x1f]*)?",
+        re.IGNORECASE,
+    )
+
     def __init__(self, file_field: FieldFile):
-        self.data = json.loads(file_field.read().decode("utf8"))
+        self.file = file_field
+
         self._is_valid = None
+        self.invalid_items = []  # [{"index": 0, "item": "...", "error": "..."}]
 
     def validate(self):
         def data_is_list():
-            return isinstance(self.data, list)
-
-        def items_are_str():
-            return all(isinstance(i, str) for i in self.data)
+            return self.read_head(1024).lstrip().startswith(b"[")
 
-        def items_are_links():
-            return all(bool(validators.url(i)) for i in self.data)
-
-        checks = [data_is_list, items_are_str, items_are_links]
+        checks = [data_is_list, self.within_size_limit]
         if self._is_valid is None:
             self._is_valid = all(check() for check in checks)
 
         return self.is_valid
 
-    def get_links(self):
+    def iter_items(self):
+        self.file.seek(0)
+        try:
+            yield from iter_json_array(self.file, self.CHUNK_SIZE)
+        except ValueError as e:
+            raise ValidationError(str(e)) from e
+
+    def validate_items(self, items: list, start_index: int = 0) -> list[dict]:
+        """Validate chunk of items and return the valid links,
+        invalid items are reported by their index in `invalid_items`"""
+        strings = [item if isinstance(item, str) else "" for item in items]
+        matches = map(self.URL_REGEX.fullmatch, strings)
+
+        links = []
+        for index, (item, match) in enumerate(zip(items, matches), start_index):
+            if not isinstance(item, str):
+                error = "item is not a string"
+            elif match or validators.url(item):
+                links.append({"url": item})
+                continue
+            else:
+                error = "item is not a valid url"
+
+            self.invalid_items.append({"index": index, "item": item, "error": error})
+
+        return links
+
+    def iter_links(self):
         self.validate()
-        return [{"url": url} for url in self.data]
+        self.invalid_items = []
+
+        index = 0
+        for items in window_iter(self.iter_items(), self.VALIDATION_CHUNK_SIZE):
+            yield from self.validate_items(items, index)
+            index += len(items)
@@ -0,0 +1,35 @@
+from django_redis import get_redis_connection
+
+
+class BookmarksBuffer:
+    """Per user redis list collecting bookmarks added one by one (live sync
+    clients) so they reach the crawl pipeline as one batch per window
+    ```
+    buffer = BookmarksBuffer(user_id)
+    size = buffer.push(bookmark_id)  # size 1 opens the window
+    buffer.pop_all()  # ids of the window, buffer is emptied atomically
+    ```
+    """
+
+    WINDOW_SECONDS = 2
+    MAX_SIZE = 50
+    KEY_TTL = 60 * 60  # don't leave abandoned buffers behind
+
+    def __init__(self, user_id: int) -> None:
+        self.key = f"bookmarks_buffer:{user_id}"
+        self.client = get_redis_connection("default")
+
+    def push(self, bookmark_id: int) -> int:
+        pipe = self.client.pipeline()
+        pipe.rpush(self.key, bookmark_id)
+        pipe.expire(self.key, self.KEY_TTL)
+        size, _ = pipe.execute()
+        return size
+
+    def pop_all(self) -> list[int]:
+        # MULTI/EXEC so an id pushed in between lands in the next window
+        pipe = self.client.pipeline(transaction=True)
+        pipe.lrange(self.key, 0, -1)
+        pipe.delete(self.key)
+        ids, _ = pipe.execute()
+        return [int(i) for i in ids]
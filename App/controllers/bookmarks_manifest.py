@@ -0,0 +1,64 @@
+import hashlib
+import json
+from collections import defaultdict
+
+from common.utils.url_utils import url_key
+
+
+class BookmarksManifest:
+    """Compact fingerprint of a processed bookmarks file used to diff the next
+    upload of the same library and process only what changed
+    ```
+    {
+        "links": {"<url key[:16]>": "<entry hash>", ...},
+        "folders": {"Dev/Python": "<hash of its entries hashes>", ...},
+    }
+    ```
+    """
+
+    KEY_LENGTH = 16  # 64 bits of the url key is plenty inside one library
+
+    def __init__(self, data: dict = None) -> None:
+        data = data or {}
+        self.links = data.get("links", {})
+        self.folders = data.get("folders", {})
+
+        self._folder_hashers = defaultdict(lambda: hashlib.blake2b(digest_size=8))
+
+    @classmethod
+    def link_key(cls, link: dict) -> str:
+        return url_key(link["url"])[: cls.KEY_LENGTH]
+
+    @staticmethod
+    def entry_hash(link: dict) -> str:
+        # what the user sees of the link, other attributes (icons, dates...)
+        # change on every export so they are ignored
+        entry = [link["url"], link.get("title"), link.get("folders")]
+        content = json.dumps(entry, ensure_ascii=False).encode("utf8")
+        return hashlib.blake2b(content, digest_size=4).hexdigest()
+
+    def add(self, link: dict) -> tuple[str, str]:
+        key, entry_hash = self.link_key(link), self.entry_hash(link)
+        self.links[key] = entry_hash
+
+        folder = "/".join(link.get("folders") or [])
+        self._folder_hashers[folder].update(entry_hash.encode())
+
+        return key, entry_hash
+
+    def is_changed(self, key: str, entry_hash: str) -> bool:
+        return self.links.get(key) != entry_hash
+
+    def removed_keys(self, new_manifest: "BookmarksManifest") -> set[str]:
+        return self.links.keys() - new_manifest.links.keys()
+
+    def changed_folders(self, new_manifest: "BookmarksManifest") -> list[str]:
+        folders = self.folders.keys() | new_manifest.folders.keys()
+        return sorted(
+            f for f in folders if self.folders.get(f) != new_manifest.folders.get(f)
+        )
+
+    def to_dict(self) -> dict:
+        folders = {f: hasher.hexdigest() for f, hasher in self._folder_hashers.items()}
+        self.folders = folders or self.folders
+        return {"links": self.links, "folders": self.folders}
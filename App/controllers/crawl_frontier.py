@@ -0,0 +1,415 @@
+import json
+import time
+import uuid
+
+from django_redis import get_redis_connection
+
+
+class CrawlFrontier:
+    """Redis crawl frontier shared by all the crawler services
+    (`manage.py crawler_service`), each service pops single bookmarks when it
+    has room so a slow domain never holds other bookmarks back
+    ```
+    frontier = CrawlFrontier()
+    if frontier.is_alive():
+        batch_id = frontier.push([(bookmark_id, url_key, domain), ...])
+        frontier.wait(batch_id, timeout=120)  # True once all are crawled
+    ```
+    A url is crawled once at a time, bookmarks of the same url (other users)
+    sent while it is in flight follow it and get the same page.
+
+    Every domain has its own queue, popping takes one bookmark per ready
+    domain in turn so domains are interleaved. A domain is ready when it has
+    a token (token bucket of `rate` per second) and less than
+    `DOMAIN_MAX_CONCURRENCY` requests in flight across all the services.
+    429/503 halve the domain rate and block it (Retry-After is honored),
+    successful responses raise it back slowly, failures without a response
+    (timeouts, dns errors) keep it as is.
+
+    A popped bookmark is leased to the service until `IN_FLIGHT_TTL`, the
+    result reported in time clears the lease, a lease past its deadline
+    (crashed or restarted service) is put back in front of its domain queue
+    by the next `pop`/`push` so its batch is still counted down.
+
+    All the keys share the `{crawler}` hash tag so the scripts, which get
+    every key they touch in KEYS, also run on a redis cluster.
+    """
+
+    DOMAINS_KEY = "{crawler}:domains"  # zset domain -> next time it is ready
+    DOMAIN_PREFIX = "{crawler}:domain:"
+    ALIVE_KEY = "{crawler}:alive"
+    LEASES_KEY = "{crawler}:leases"  # zset bookmark id -> lease deadline
+    LEASED_KEY = "{crawler}:leased"  # hash bookmark id -> entry
+    ALIVE_TTL = 10  # seconds without heartbeat to consider all services down
+    # url locks, followers and batches while the bookmarks wait in the queues
+    QUEUED_TTL = 24 * 60 * 60
+    IN_FLIGHT_TTL = 10 * 60  # from the pop, lease and url lock of an entry
+    DONE_TTL = 60 * 60
+    MIN_WAIT = 10 * 60  # seconds a sender waits for its batch at least
+
+    # politeness per domain, shared by all the services
+    DOMAIN_MAX_CONCURRENCY = 4
+    DOMAIN_BURST = 4  # tokens
+    DOMAIN_RATE = 2.0  # requests/second to start with
+    MIN_DOMAIN_RATE = 0.05  # one request every 20 seconds at worst
+    MAX_DOMAIN_RATE = 8.0
+    DOMAIN_RATE_STEP = 0.1  # added by every successful response
+    BACKOFF_STATUSES = (429, 503)
+    MAX_RETRY_AFTER = 5 * 60
+
+    # KEYS: in flight, followers, domain queue, domains
+    # ARGV: entry, queued ttl, domain, now
+    ENQUEUE_SCRIPT = """
+    if redis.call("SET", KEYS[1], 1, "NX", "EX", ARGV[2]) then
+        redis.call("LPUSH", KEYS[3], ARGV[1])
+        redis.call("ZADD", KEYS[4], "NX", ARGV[4], ARGV[3])
+        return 1
+    end
+    redis.call("RPUSH", KEYS[2], ARGV[1])
+    redis.call("EXPIRE", KEYS[2], ARGV[2])
+    return 0
+    """
+
+    # Pops one entry of a ready domain
+    # KEYS: domains, domain queue, domain active, domain bucket, leases, leased
+    # ARGV: now, domain, max concurrency, rate, burst, in flight ttl, bucket ttl
+    POP_SCRIPT = """
+    local now, domain = tonumber(ARGV[1]), ARGV[2]
+    local cap = tonumber(ARGV[3])
+    local default_rate, burst = tonumber(ARGV[4]), tonumber(ARGV[5])
+
+    redis.call("ZREMRANGEBYSCORE", KEYS[3], "-inf", now - ARGV[6])
+    local state = redis.call("HMGET", KEYS[4], "tokens", "ts", "rate", "until")
+    local rate = tonumber(state[3]) or default_rate
+    local last = math.min(now, tonumber(state[2]) or now)
+    local tokens = math.min(burst, (tonumber(state[1]) or burst) + (now - last) * rate)
+
+    local entry = false
+    if tonumber(state[4] or 0) > now then
+        redis.call("ZADD", KEYS[1], state[4], domain)
+        return entry
+    elseif redis.call("LLEN", KEYS[2]) == 0 then
+        redis.call("ZREM", KEYS[1], domain)
+    elseif redis.call("ZCARD", KEYS[3]) >= cap then
+        -- retried once a slot could be free
+        redis.call("ZADD", KEYS[1], now + 1 / rate, domain)
+    elseif tokens < 1 then
+        redis.call("ZADD", KEYS[1], now + (1 - tokens) / rate, domain)
+    else
+        entry = redis.call("RPOP", KEYS[2])
+        tokens = tokens - 1
+
+        local id = cjson.decode(entry)["id"]
+        redis.call("ZADD", KEYS[3], now, id)
+        redis.call("ZADD", KEYS[5], now + ARGV[6], id)
+        redis.call("HSET", KEYS[6], id, entry)
+        redis.call("EXPIRE", KEYS[3], ARGV[6])
+        local wait = math.max(0, 1 - tokens) / rate
+        redis.call("ZADD", KEYS[1], now + wait, domain)
+    end
+
+    redis.call("HSET", KEYS[4], "tokens", tokens, "ts", now)
+    redis.call("EXPIRE", KEYS[4], ARGV[7])
+    return entry
+    """
+
+    # Puts an entry past its lease deadline back in front of its domain queue
+    # KEYS: leases, leased, in flight, domain queue, domain active, domains
+    # ARGV: bookmark id, now, queued ttl, domain
+    REQUEUE_SCRIPT = """
+    local deadline = redis.call("ZSCORE", KEYS[1], ARGV[1])
+    if not deadline or tonumber(deadline) > tonumber(ARGV[2]) then
+        return 0
+    end
+    local entry = redis.call("HGET", KEYS[2], ARGV[1])
+    redis.call("ZREM", KEYS[1], ARGV[1])
+    redis.call("HDEL", KEYS[2], ARGV[1])
+    redis.call("ZREM", KEYS[5], ARGV[1])
+    if not entry then
+        return 0
+    end
+
+    redis.call("SET", KEYS[3], 1, "EX", ARGV[3])
+    redis.call("RPUSH", KEYS[4], entry)
+    redis.call("ZADD", KEYS[6], "NX", ARGV[2], ARGV[4])
+    return 1
+    """
+
+    # Returns {leased, followers}, an entry requeued since its pop is not
+    # leased anymore, its url and followers belong to the requeued one
+    # KEYS: in flight, followers, domain active, domain bucket, leases, leased
+    # ARGV: bookmark id, now, outcome (backoff/success/empty), retry after,
+    #       rate, min rate, max rate, rate step, bucket ttl
+    COMPLETE_SCRIPT = """
+    local leased = redis.call("HDEL", KEYS[6], ARGV[1])
+    local followers = {}
+    if leased == 1 then
+        redis.call("ZREM", KEYS[5], ARGV[1])
+        redis.call("ZREM", KEYS[3], ARGV[1])
+        followers = redis.call("LRANGE", KEYS[2], 0, -1)
+        redis.call("DEL", KEYS[1], KEYS[2])
+    end
+
+    local now = tonumber(ARGV[2])
+    local rate = tonumber(redis.call("HGET", KEYS[4], "rate")) or tonumber(ARGV[5])
+    if ARGV[3] == "backoff" then
+        rate = math.max(tonumber(ARGV[6]), rate / 2)
+        local blocked = now + math.max(tonumber(ARGV[4]), 1 / rate)
+        redis.call(
+            "HSET", KEYS[4], "rate", rate, "until", blocked, "tokens", 0, "ts", blocked
+        )
+    elseif ARGV[3] == "success" then
+        rate = math.min(tonumber(ARGV[7]), rate + tonumber(ARGV[8]))
+        redis.call("HSET", KEYS[4], "rate", rate)
+    end
+    redis.call("EXPIRE", KEYS[4], ARGV[9])
+
+    return {leased, followers}
+    """
+
+    def __init__(self) -> None:
+        self.client = get_redis_connection("default")
+        self.enqueue_script = self.client.register_script(self.ENQUEUE_SCRIPT)
+        self.pop_script = self.client.register_script(self.POP_SCRIPT)
+        self.requeue_script = self.client.register_script(self.REQUEUE_SCRIPT)
+        self.complete_script = self.client.register_script(self.COMPLETE_SCRIPT)
+
+    @staticmethod
+    def url_keys(url_key: str) -> list[str]:
+        return [
+            f"{{crawler}}:in_flight:{url_key}",
+            f"{{crawler}}:followers:{url_key}",
+        ]
+
+    @classmethod
+    def domain_key(cls, kind: str, domain: str) -> str:
+        """kind: queue (list of entries), active (zset of bookmarks in
+        flight), bucket (hash of the rate limit state)"""
+        return f"{cls.DOMAIN_PREFIX}{kind}:{domain}"
+
+    @staticmethod
+    def batch_key(batch_id: str) -> str:
+        return f"{{crawler}}:batch:{batch_id}"
+
+    @staticmethod
+    def done_key(batch_id: str) -> str:
+        return f"{{crawler}}:done:{batch_id}"
+
+    # Sender side
+
+    def is_alive(self) -> bool:
+        return bool(self.client.exists(self.ALIVE_KEY))
+
+    def push(self, bookmarks: list[tuple[int, str, str]]) -> str:
+        """Enqueue (bookmark id, url key, domain) as one batch to wait for"""
+        self.requeue_expired()
+
+        batch_id = uuid.uuid4().hex
+        sent_at = time.time()
+
+        entries = [
+            {
+                "id": bookmark_id,
+                "key": url_key,
+                "domain": domain,
+                "batch": batch_id,
+                "sent_at": sent_at,  # latency reported by the services
+            }
+            for bookmark_id, url_key, domain in bookmarks
+        ]
+
+        pipe = self.client.pipeline()
+        pipe.set(self.batch_key(batch_id), len(bookmarks), ex=self.QUEUED_TTL)
+        self.enqueue(entries, pipe)
+        pipe.execute()
+
+        if not bookmarks:
+            self.finish_batches([batch_id])
+        return batch_id
+
+    def enqueue(self, entries: list[dict], pipe) -> None:
+        for entry in entries:
+            self.enqueue_script(
+                keys=[
+                    *self.url_keys(entry["key"]),
+                    self.domain_key("queue", entry["domain"]),
+                    self.DOMAINS_KEY,
+                ],
+                args=[
+                    json.dumps(entry),
+                    self.QUEUED_TTL,
+                    entry["domain"],
+                    time.time(),
+                ],
+                client=pipe,
+            )
+
+    def wait(self, batch_id: str, timeout: int) -> bool:
+        return self.client.blpop(self.done_key(batch_id), timeout=timeout) is not None
+
+    def wait_timeout(self) -> int:
+        """Seconds to wait for a batch pushed now, `MIN_WAIT` and the time the
+        longest domain queue takes at its current rate (domains are crawled
+        in parallel)"""
+        domains = [d.decode() for d in self.client.zrange(self.DOMAINS_KEY, 0, -1)]
+
+        pipe = self.client.pipeline(transaction=False)
+        for domain in domains:
+            pipe.llen(self.domain_key("queue", domain))
+            pipe.hget(self.domain_key("bucket", domain), "rate")
+        values = pipe.execute()
+
+        backlog = 0
+        for length, rate in zip(values[::2], values[1::2]):
+            backlog = max(backlog, length / float(rate or self.DOMAIN_RATE))
+        return int(self.MIN_WAIT + backlog)
+
+    # Service side
+
+    def heartbeat(self) -> None:
+        self.client.set(self.ALIVE_KEY, 1, ex=self.ALIVE_TTL)
+
+    def pop(self, count: int) -> list[dict]:
+        """Up to `count` entries the domains limits allow right now, one
+        entry per ready domain in turn so domains are interleaved"""
+        self.requeue_expired()
+
+        popped = []
+        while len(popped) < count:
+            now = time.time()
+            domains = self.client.zrangebyscore(
+                self.DOMAINS_KEY, "-inf", now, start=0, num=count - len(popped)
+            )
+            if not domains:
+                break
+
+            pipe = self.client.pipeline(transaction=False)
+            for domain in domains:
+                domain = domain.decode()
+                self.pop_script(
+                    keys=[
+                        self.DOMAINS_KEY,
+                        self.domain_key("queue", domain),
+                        self.domain_key("active", domain),
+                        self.domain_key("bucket", domain),
+                        self.LEASES_KEY,
+                        self.LEASED_KEY,
+                    ],
+                    args=[
+                        now,
+                        domain,
+                        self.DOMAIN_MAX_CONCURRENCY,
+                        self.DOMAIN_RATE,
+                        self.DOMAIN_BURST,
+                        self.IN_FLIGHT_TTL,
+                        self.DONE_TTL,
+                    ],
+                    client=pipe,
+                )
+
+            entries = [json.loads(e) for e in pipe.execute() if e]
+            if not entries:  # all the ready domains are limited
+                break
+            popped.extend(entries)
+
+        # from now the url lock is released if the service crashes, the
+        # followers are kept for the next bookmark crawling the url
+        pipe = self.client.pipeline(transaction=False)
+        for entry in popped:
+            in_flight, followers = self.url_keys(entry["key"])
+            pipe.set(in_flight, 1, ex=self.IN_FLIGHT_TTL, xx=True)
+            pipe.expire(followers, self.QUEUED_TTL)
+        pipe.execute()
+
+        return popped
+
+    def requeue_expired(self) -> int:
+        """Put the entries whose lease is past its deadline (their service
+        crashed or restarted before reporting them) back in the queues"""
+        now = time.time()
+        ids = self.client.zrangebyscore(self.LEASES_KEY, "-inf", now)
+        if not ids:
+            return 0
+
+        pipe = self.client.pipeline(transaction=False)
+        for bookmark_id, entry in zip(ids, self.client.hmget(self.LEASED_KEY, ids)):
+            # without its entry the script only drops the lease
+            entry = json.loads(entry) if entry else {"key": "", "domain": ""}
+            self.requeue_script(
+                keys=[
+                    self.LEASES_KEY,
+                    self.LEASED_KEY,
+                    self.url_keys(entry["key"])[0],
+                    self.domain_key("queue", entry["domain"]),
+                    self.domain_key("active", entry["domain"]),
+                    self.DOMAINS_KEY,
+                ],
+                args=[bookmark_id, now, self.QUEUED_TTL, entry["domain"]],
+                client=pipe,
+            )
+        return sum(pipe.execute())
+
+    def complete(
+        self,
+        entry: dict,
+        status: int = None,
+        retry_after: int = None,
+        requeue_followers: bool = False,
+    ) -> list[dict]:
+        """Release the url and domain slot of a crawled (or failed) entry,
+        the response status adapts the domain rate, returns the entries that
+        followed it, the batches of all of them are counted down.
+        `requeue_followers` when the entry has no page to share (not
+        modified since its own last crawl), they are crawled on their own"""
+        if status in self.BACKOFF_STATUSES:
+            outcome = "backoff"
+        elif status is not None and status < 400:
+            outcome = "success"
+        else:  # no response (timeout, dns error) or an error page
+            outcome = ""
+        retry_after = min(retry_after or 0, self.MAX_RETRY_AFTER)
+
+        leased, followers = self.complete_script(
+            keys=[
+                *self.url_keys(entry["key"]),
+                self.domain_key("active", entry["domain"]),
+                self.domain_key("bucket", entry["domain"]),
+                self.LEASES_KEY,
+                self.LEASED_KEY,
+            ],
+            args=[
+                entry["id"],
+                time.time(),
+                outcome,
+                retry_after,
+                self.DOMAIN_RATE,
+                self.MIN_DOMAIN_RATE,
+                self.MAX_DOMAIN_RATE,
+                self.DOMAIN_RATE_STEP,
+                self.DONE_TTL,
+            ],
+        )
+        if not leased:  # requeued meanwhile, counted once crawled again
+            return []
+        followers = [json.loads(f) for f in followers]
+
+        entries = [entry, *followers]
+        pipe = self.client.pipeline()
+        if requeue_followers and followers:
+            self.enqueue(followers, pipe)
+            entries, followers = [entry], []
+        for e in entries:
+            pipe.decr(self.batch_key(e["batch"]))
+        lefts = pipe.execute()[-len(entries) :]  # after the requeued
+
+        self.finish_batches([e["batch"] for e, left in zip(entries, lefts) if not left])
+
+        return followers
+
+    def finish_batches(self, batch_ids: list[str]) -> None:
+        pipe = self.client.pipeline()
+        for batch_id in batch_ids:
+            pipe.delete(self.batch_key(batch_id))
+            pipe.lpush(self.done_key(batch_id), 1)
+            pipe.expire(self.done_key(batch_id), self.DONE_TTL)
+        pipe.execute()
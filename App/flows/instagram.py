@@ -16,10 +16,13 @@ class InstagramBookmarkHooks(BookmarkHooks):
 
     def post_batch(self) -> typing.Callable:
         def method(bookmark_ids):
-            from App import tasks
+            from App import controllers, tasks
 
-            batch_size = 30
-            id_groups = window_list(bookmark_ids, batch_size)
+            # one batch for the crawler services, windows between the workers
+            # when each of them crawls in its own process
+            id_groups = [bookmark_ids]
+            if not controllers.CrawlFrontier().is_alive():
+                id_groups = window_list(bookmark_ids, tasks.CRAWL_PROCESS_BATCH_SIZE)
 
             for group in id_groups:
                 tasks.crawl_bookmarks_task.delay(group)
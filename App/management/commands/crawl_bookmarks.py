@@ -21,6 +21,7 @@ class Command(BaseCommand):
 
     def handle(self, *args, **kwargs):
         bookmarks = models.Bookmark.objects.filter(pk__in=kwargs["bookmarks"])
+        bookmarks = bookmarks.with_validators()
         if bookmarks.exists() is False:
             return
 
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+
+from crawler.spiders.bookmarks_frontier import BookmarksFrontierSpider
+
+
+class Command(BaseCommand):
+    help = "Run one long lived Scrapy engine crawling the bookmarks frontier"
+
+    def handle(self, *args, **kwargs):
+        process = CrawlerProcess(settings=get_project_settings())
+        process.crawl(BookmarksFrontierSpider)
+        process.start()
@@ -1,8 +1,14 @@
 import math
+import secrets
+from typing import Iterable
 
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.db.models.expressions import RawSQL
 from django.db.models.signals import post_save, pre_save
+from django.utils import timezone
 
+from common.utils.model_utils import copy_to_table
 from realtime.common.redis_utils import RedisPubSub
 
 
@@ -45,40 +51,180 @@ class BookmarkQuerySet(models.QuerySet):
     def by_user(self, user):
         return self.filter(user=user)
 
+    def new_url_keys(self, url_keys: Iterable[str]) -> list[str]:
+        """Return the url keys that are not stored in this queryset, keys are
+        staged with `unnest` and anti joined inside the database so only
+        the new ones come back"""
+        url_keys = list(url_keys)
+        if not url_keys:
+            return []
+
+        stored = self.filter(url_key=RawSQL("new_keys.url_key", ())).values("pk")
+        stored_sql, stored_params = stored.query.sql_with_params()
+
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                "SELECT new_keys.url_key FROM unnest(%s::text[]) AS new_keys(url_key) "
+                f"WHERE NOT EXISTS ({stored_sql})",
+                [url_keys, *stored_params],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def lock_url_key(self, user_id: int, url_key: str) -> None:
+        """Lock a url of the user until the transaction ends so adding it is
+        check-then-insert safe, the url is not unique in the table (hidden
+        bookmarks and imports may repeat it)"""
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(hashtextextended(%s, %s))",
+                [url_key, user_id],
+            )
+
+    def with_validators(self):
+        """Annotate `webpage_<validator>` of the latest webpage (etag,
+        last_modified, content_hash) so re-crawls can be conditional"""
+        from App.models import BookmarkWebpage
+
+        latest = BookmarkWebpage.objects.filter(bookmark=OuterRef("pk")).order_by("-id")
+        return self.annotate(
+            **{
+                f"webpage_{name}": Subquery(latest.values(name)[:1])
+                for name in BookmarkWebpage.VALIDATORS
+            }
+        )
+
+    def clone_sources(self, user, url_keys: Iterable[str]) -> dict[str, int]:
+        """Find fresh processed bookmarks of other users to clone instead of
+        crawling again, return {url_key: source_bookmark_id}"""
+        from App.models import Bookmark
+
+        url_keys = list(url_keys)
+        if not url_keys:
+            return {}
+
+        fresh_since = timezone.now() - Bookmark.CLONE_FRESHNESS
+        sources = (
+            self.exclude(user=user)
+            .filter(
+                Q(process_status=Bookmark.ProcessStatus.CLONED.value)
+                | Q(process_status__gte=Bookmark.ProcessStatus.CRAWLED.value),
+                url_key__in=url_keys,
+                updated_at__gte=fresh_since,
+                webpages__isnull=False,
+            )
+            .order_by("url_key", "-updated_at")
+            .distinct("url_key")
+            .values_list("url_key", "id")
+        )
+        return dict(sources)
+
+    def _publish_created(self, objs):
+        if objs:
+            user_id = objs[0].user_id
+            statuses = {}  # {status: [ids]}
+            for obj in objs:
+                statuses.setdefault(obj.process_status, []).append(obj.id)
+
+            for status, bookmark_ids in statuses.items():
+                RedisPubSub.pub_bookmarks_change(user_id, bookmark_ids, status)
+
     def bulk_create(self, objs, **kwargs):
-        result = super().bulk_create(objs, **kwargs)
+        objs = list(objs)
+        for obj in objs:
+            if obj.url_key is None:
+                obj.set_url_fields()
 
-        if result:
-            user = result[0].user
-            for obj in result:
-                RedisPubSub.pub(
-                    {
-                        "type": RedisPubSub.MessageTypes.BOOKMARK_CHANGE,
-                        "user_id": user.id,
-                        "bookmark_id": obj.id,
-                        "status": obj.process_status,
-                    }
-                )
+        result = super().bulk_create(objs, **kwargs)
+        self._publish_created(result)
 
         return result
 
+    def copy_create(self, objs) -> list:
+        """High throughput `bulk_create` for big imports, rows are loaded with
+        `COPY` into a staging table then inserted with one `INSERT ... SELECT`
+        that resolves the website of each bookmark by its domain"""
+        objs = list(objs)
+        if not objs:
+            return objs
+
+        for obj in objs:
+            if obj.url_key is None:
+                obj.set_url_fields()
+
+        columns = [
+            "user_id",
+            "parent_file_id",
+            "website_id",
+            "url",
+            "url_key",
+            "domain",
+            "uuid",
+            "title",
+            "more_data",
+            "image_url",
+            "process_status",
+            "favorite",
+            "hidden",
+            "added_at",
+        ]
+        rows = ([getattr(obj, column) for column in columns] for obj in objs)
+
+        table = self.model._meta.db_table
+        website_table = self.model._meta.get_field(
+            "website"
+        ).related_model._meta.db_table
+        staging_table = f"bookmark_staging_{secrets.token_hex(4)}"
+
+        staging_columns = ", ".join(f'"{c}"' for c in columns)
+        select_columns = ", ".join(
+            'COALESCE(s."website_id", w."id")' if c == "website_id" else f's."{c}"'
+            for c in columns
+        )
+
+        connection = connections[self.db]
+        with transaction.atomic(using=self.db), connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE "{staging_table}" ON COMMIT DROP AS '
+                f'SELECT {staging_columns} FROM "{table}" WITH NO DATA'
+            )
+            copy_to_table(cursor, staging_table, columns, rows)
+            cursor.execute(
+                f'INSERT INTO "{table}" '
+                f'({staging_columns}, "created_at", "updated_at") '
+                f"SELECT {select_columns}, now(), now() "
+                f'FROM "{staging_table}" s '
+                f'LEFT JOIN "{website_table}" w '
+                'ON w."user_id" = s."user_id" AND w."domain" = s."domain" '
+                'RETURNING "id", "uuid", "website_id"'
+            )
+            inserted = {str(row[1]): row for row in cursor.fetchall()}
+            cursor.execute(f'DROP TABLE "{staging_table}"')
+
+        for obj in objs:
+            obj.id, _, obj.website_id = inserted[str(obj.uuid)]
+            obj._state.adding = False
+            obj._state.db = self.db
+
+        self._publish_created(objs)
+
+        return objs
+
     def update_process_status(self, new_status) -> int:
         objs = list(self)
         if not objs:
             return 0
 
-        user_id = objs[0].user.id
+        user_id = objs[0].user_id
+        changed = {}  # {previous status: [ids]}
         for obj in objs:
             if obj.process_status >= new_status:
                 continue
+            changed.setdefault(obj.process_status, []).append(obj.id)
             obj.process_status = new_status
-            RedisPubSub.pub(
-                {
-                    "type": RedisPubSub.MessageTypes.BOOKMARK_CHANGE,
-                    "user_id": user_id,
-                    "bookmark_id": obj.id,
-                    "status": new_status,
-                }
+
+        for previous_status, bookmark_ids in changed.items():
+            RedisPubSub.pub_bookmarks_change(
+                user_id, bookmark_ids, new_status, previous_status
             )
 
         return self.bulk_update(objs, ["process_status"])
@@ -105,6 +251,17 @@ class BookmarkQuerySet(models.QuerySet):
 
         return self.update_process_status(Bookmark.ProcessStatus.CRAWLED.value)
 
+    def processing(self):
+        """Bookmarks still waiting for the crawl to finish"""
+        from App.models import Bookmark
+
+        return self.filter(
+            process_status__in=[
+                Bookmark.ProcessStatus.CREATED.value,
+                Bookmark.ProcessStatus.START_CRAWL.value,
+            ]
+        )
+
 
 class BookmarkManager(models.Manager):
     def get_queryset(self):
@@ -138,3 +295,42 @@ class TagQuerySet(models.QuerySet):
 class TagManager(models.Manager):
     def get_queryset(self):
         return TagQuerySet(self.model, using=self._db)
+
+
+class WebsiteQuerySet(models.QuerySet):
+    def resolve(self, user, favicons: dict) -> dict[str, int]:
+        """Get or create the user websites in one statement and return
+        {domain: website_id}, `favicons` maps each domain to its favicon
+        (None keeps the stored one), rows are only rewritten on new favicon"""
+        if not favicons:
+            return {}
+
+        table = self.model._meta.db_table
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                "WITH input AS ("
+                "  SELECT * FROM unnest(%s::text[], %s::text[]) AS i(domain, favicon)"
+                "), upserted AS ("
+                f'  INSERT INTO "{table}" AS w '
+                '  ("user_id", "domain", "favicon", "created_at", "updated_at")'
+                "  SELECT %s, i.domain, i.favicon, now(), now() FROM input i"
+                '  ON CONFLICT ("user_id", "domain") DO UPDATE'
+                '  SET "favicon" = EXCLUDED."favicon", "updated_at" = now()'
+                '  WHERE EXCLUDED."favicon" IS NOT NULL'
+                '  AND w."favicon" IS DISTINCT FROM EXCLUDED."favicon"'
+                '  RETURNING w."id", w."domain"'
+                ") "
+                "SELECT id, domain FROM upserted "
+                "UNION ALL "
+                f'SELECT w."id", w."domain" FROM "{table}" w '
+                'JOIN input i ON w."domain" = i.domain '
+                'WHERE w."user_id" = %s '
+                'AND w."domain" NOT IN (SELECT domain FROM upserted)',
+                [list(favicons.keys()), list(favicons.values()), user.id, user.id],
+            )
+            return {domain: website_id for website_id, domain in cursor.fetchall()}
+
+
+class WebsiteManager(models.Manager):
+    def get_queryset(self):
+        return WebsiteQuerySet(self.model, using=self._db)
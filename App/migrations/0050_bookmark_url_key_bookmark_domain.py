@@ -0,0 +1,56 @@
+# Generated by Django 4.2.16 on 2026-10-18 18:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+from common.utils.url_utils import url_domain, url_key
+
+
+def backfill_url_fields(apps, schema_editor):
+    Bookmark = apps.get_model("App", "Bookmark")
+
+    batch_size = 2000
+    bookmarks = Bookmark.objects.filter(url_key__isnull=True).only("id", "url")
+
+    batch = []
+    for bookmark in bookmarks.iterator(chunk_size=batch_size):
+        bookmark.url_key = url_key(bookmark.url)
+        bookmark.domain = url_domain(bookmark.url)
+        batch.append(bookmark)
+
+        if len(batch) >= batch_size:
+            Bookmark.objects.bulk_update(batch, ["url_key", "domain"])
+            batch = []
+
+    Bookmark.objects.bulk_update(batch, ["url_key", "domain"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("App", "0049_remove_wordweight_bookmark_remove_tag_alias_name_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bookmark",
+            name="domain",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=255, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="bookmark",
+            name="url_key",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=32, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bookmark",
+            index=models.Index(
+                fields=["user", "url_key"], name="App_bookmar_user_id_44e6bf_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_url_fields, migrations.RunPython.noop),
+    ]
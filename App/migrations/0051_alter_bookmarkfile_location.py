@@ -0,0 +1,28 @@
+# Generated by Django 4.2.16 on 2026-10-18 18:31
+
+import django.core.validators
+from django.db import migrations, models
+
+import common.utils.model_utils
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("App", "0050_bookmark_url_key_bookmark_domain"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="bookmarkfile",
+            name="location",
+            field=models.FileField(
+                upload_to="users/bookmarks/",
+                validators=[
+                    django.core.validators.FileExtensionValidator(
+                        ["html", "json", "gz", "zst"]
+                    ),
+                    common.utils.model_utils.FileSizeValidator(20),
+                ],
+            ),
+        ),
+    ]
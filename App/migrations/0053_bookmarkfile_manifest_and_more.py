@@ -0,0 +1,22 @@
+# Generated by Django 4.2.16 on 2026-10-18 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("App", "0052_bookmarkfileupload"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bookmarkfile",
+            name="manifest",
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="bookmarkfile",
+            name="removed_links_count",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
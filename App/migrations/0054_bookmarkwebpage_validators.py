@@ -0,0 +1,27 @@
+# Generated by Django 4.2.16 on 2026-10-18 21:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("App", "0053_bookmarkfile_manifest_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bookmarkwebpage",
+            name="content_hash",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="bookmarkwebpage",
+            name="etag",
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="bookmarkwebpage",
+            name="last_modified",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:05
+
+from django.db import migrations
+from django.db.models import Q
+
+from common.utils.url_utils import url_key
+
+
+def rekey_fragment_routes(apps, schema_editor):
+    # keys of hash routed urls (`#/`, `#!`) were computed without the fragment
+    Bookmark = apps.get_model("App", "Bookmark")
+
+    bookmarks = Bookmark.objects.filter(Q(url__contains="#/") | Q(url__contains="#!"))
+    bookmarks = list(bookmarks.only("id", "url"))
+    for bookmark in bookmarks:
+        bookmark.url_key = url_key(bookmark.url)
+
+    Bookmark.objects.bulk_update(bookmarks, ["url_key"], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("App", "0054_bookmarkwebpage_validators"),
+    ]
+
+    operations = [
+        migrations.RunPython(rekey_fragment_routes, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,13 @@
+import hashlib
+import json
+import os
 import secrets
 import uuid
+from datetime import timedelta
+from typing import Generator
 
 import requests
-import urllib3
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchVectorField
@@ -13,14 +18,23 @@ from django.core.validators import (
     MaxValueValidator,
     MinValueValidator,
 )
-from django.db import models, transaction
+from django.db import connection, models, transaction
+from django.db.models.functions import Left
+from django.utils import timezone
 
 from App import choices, controllers, flows, managers, tasks
-from common.utils.file_utils import hash_file, random_filename
+from common.utils.file_utils import (
+    DecompressedFile,
+    MovableFile,
+    file_compression,
+    hash_file,
+    random_filename,
+    strip_compression_extension,
+)
 from common.utils.image_utils import compress_image, download_image, resize_image
-from common.utils.model_utils import FileSizeValidator, bulk_clone, clone
+from common.utils.model_utils import FileSizeValidator
 from common.utils.time_utils import fromtimestamp
-from common.utils.url_utils import url_builder
+from common.utils.url_utils import url_builder, url_domain, url_key
 from realtime.common.redis_utils import RedisPubSub
 
 User = get_user_model()
@@ -40,23 +54,42 @@ class BookmarkFile(models.Model):
         User, on_delete=models.CASCADE, related_name="bookmark_files"
     )
 
+    MAX_SIZE_MB = 20  # of the decompressed content
+    CONTENT_EXTENSIONS = ["html", "json"]  # can be compressed as gz, zst
+
     # Required
     location = models.FileField(
         upload_to="users/bookmarks/",
-        validators=[FileExtensionValidator(["html", "json"]), FileSizeValidator(20)],
+        validators=[
+            FileExtensionValidator([*CONTENT_EXTENSIONS, "gz", "zst"]),
+            FileSizeValidator(MAX_SIZE_MB),
+        ],
     )
 
     file_hash = models.CharField(max_length=64, blank=True, null=True, editable=False)
 
+    # url keys and folders hashes of the processed file to diff next upload
+    manifest = models.JSONField(blank=True, null=True, editable=False)
+
     # Analytics
     total_links_count = models.PositiveIntegerField(blank=True, null=True)
     succeeded_links_count = models.PositiveIntegerField(blank=True, null=True)
     failed_links_count = models.PositiveIntegerField(blank=True, null=True)
+    removed_links_count = models.PositiveIntegerField(blank=True, null=True)
 
     # Timing
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # set on files created by `create_batch`, they are ingested together
+    batched = False
+    # items of the file that are not bookmarks, set once all links are read
+    invalid_items = ()
+    # manifest keys of the links changed or removed since the last upload,
+    # changed ones are set while links are read, removed once all are read
+    changed_keys = frozenset()
+    removed_keys = frozenset()
+
     class Meta:
         unique_together = ("user", "file_hash")
 
@@ -71,6 +104,43 @@ class BookmarkFile(models.Model):
 
         return super().save(*args, **kwargs)
 
+    @classmethod
+    def create_batch(cls, user, files: list) -> list["BookmarkFile"]:
+        """Store files uploaded together (e.g. exports of many browsers) and
+        ingest them by one `store_bookmarks_batch_task` so their links are
+        deduped across files, already uploaded files are returned as is"""
+        bookmark_files = {}  # {file_hash: bookmark_file}
+        created_ids = []
+
+        with transaction.atomic():
+            for file in files:
+                file_hash = hash_file(file)
+                if file_hash in bookmark_files:
+                    continue
+
+                existing = user.bookmark_files.filter(file_hash=file_hash).first()
+                if existing is None:
+                    existing = cls(user=user, location=file)
+                    existing.batched = True
+                    existing.save()
+                    created_ids.append(existing.id)
+
+                bookmark_files[file_hash] = existing
+
+            def event():
+                tasks.store_bookmarks_batch_task.delay(created_ids)
+                RedisPubSub.pub(
+                    {
+                        "type": RedisPubSub.MessageTypes.INIT_UPLOAD,
+                        "user_id": user.id,
+                    }
+                )
+
+            if created_ids:
+                transaction.on_commit(event)
+
+        return list(bookmark_files.values())
+
     # Computed
     @property
     def path(self) -> str:
@@ -78,15 +148,19 @@ class BookmarkFile(models.Model):
 
     @property
     def file_content(self) -> str:
-        return self.location.read().decode("utf8")
+        return self.file_obj.file.read().decode("utf8")
 
     @property
     def is_html(self) -> bool:
-        return self.path.endswith(".html")
+        return strip_compression_extension(self.path).endswith(".html")
 
     @property
     def is_json(self) -> bool:
-        return self.path.endswith(".json")
+        return strip_compression_extension(self.path).endswith(".json")
+
+    @property
+    def compression(self) -> str | None:
+        return file_compression(self.location)
 
     @property
     def file_manager(self) -> controllers.BookmarkFileManager:
@@ -104,53 +178,134 @@ class BookmarkFile(models.Model):
     @property
     def file_obj(self) -> controllers.BookmarkFileManager:
         self.location.seek(0)
-        return self.file_manager(self.location)
+
+        # compressed files are decompressed while parsing, never on disk
+        file = self.location
+        if compression := self.compression:
+            max_size = self.MAX_SIZE_MB * 1024 * 1024
+            file = DecompressedFile(file, compression, max_size=max_size)
+
+        return self.file_manager(file)
 
     @property
     def bookmarks_links(self) -> list[dict]:
         file_obj = self.file_obj
         return file_obj.get_links()
 
-    def cleaned_bookmarks_links(self) -> list[dict]:
-        # remove duplication from bookmarks (unique on url)
-        new_bookmarks_map = {b["url"]: b for b in self.bookmarks_links}
-        new_urls = set(new_bookmarks_map.keys())
+    def iter_bookmarks_links(self) -> Generator[dict, None, None]:
+        return self.file_obj.iter_links()
+
+    @property
+    def previous_manifest(self) -> controllers.BookmarksManifest | None:
+        previous = (
+            self.user.bookmark_files.exclude(id=self.id)
+            .filter(manifest__isnull=False)
+            .order_by("-created_at")
+            .values_list("manifest", flat=True)
+            .first()
+        )
+        return previous and controllers.BookmarksManifest(previous)
+
+    def iter_changed_bookmarks_links(self) -> Generator[dict, None, None]:
+        """Yield only links added or changed since the user last uploaded file,
+        the manifest of this file is ready once all links are read"""
+        previous = self.previous_manifest
+        manifest = controllers.BookmarksManifest()
+        self.changed_keys = set()
+
+        file_obj = self.file_obj
+        for link in file_obj.iter_links():
+            key, entry_hash = manifest.add(link)
+            if previous is None or previous.is_changed(key, entry_hash):
+                if previous is not None and key in previous.links:
+                    self.changed_keys.add(key)
+                yield link
+
+        self.invalid_items = getattr(file_obj, "invalid_items", [])
+
+        self.manifest = manifest.to_dict()
+        self.removed_keys = previous.removed_keys(manifest) if previous else set()
+        self.removed_links_count = len(self.removed_keys)
+        self.changed_folders = previous.changed_folders(manifest) if previous else []
+
+    def store_manifest(self):
+        # `update` to skip `save` validation of the file content
+        BookmarkFile.objects.filter(id=self.id).update(
+            manifest=self.manifest, removed_links_count=self.removed_links_count
+        )
+
+    @classmethod
+    def hide_removed_bookmarks(cls, parents: list["BookmarkFile"]) -> int:
+        """Hide (not delete, the user can restore them) the bookmarks imported
+        from files whose links are in none of the files uploaded together"""
+        removed_keys = set.intersection(*(set(p.removed_keys) for p in parents))
+        if not removed_keys:
+            return 0
+
+        key_length = controllers.BookmarksManifest.KEY_LENGTH
+        return (
+            parents[0]
+            .user.bookmarks.filter(parent_file__isnull=False)
+            .annotate(link_key=Left("url_key", key_length))
+            .filter(link_key__in=removed_keys)
+            .update(hidden=True, updated_at=timezone.now())
+        )
 
-        # get only new bookmarks for this user
-        stored_urls = set(self.user.bookmarks.only("url").values_list("url", flat=True))
+    def update_changed_bookmarks(self, bookmarks_links: dict[str, dict]) -> int:
+        """Write the title and folders of links changed since the last upload
+        on the user bookmarks of their url key"""
+        changes = {
+            key: self.init_bookmark(dict(b)) for key, b in bookmarks_links.items()
+        }
+        bookmarks = list(self.user.bookmarks.filter(url_key__in=changes.keys()))
+
+        now = timezone.now()
+        for bookmark in bookmarks:
+            change = changes[bookmark.url_key]
+            bookmark.title, bookmark.more_data = change.title, change.more_data
+            bookmark.updated_at = now
+
+        return Bookmark.objects.bulk_update(
+            bookmarks, ["title", "more_data", "updated_at"], batch_size=250
+        )
 
-        new_urls -= stored_urls
-        del stored_urls
+    def cleaned_bookmarks_links(
+        self, bookmarks_links: list[dict] = None
+    ) -> tuple[list[dict], dict[int, dict]]:
+        """New links of the user as (links to store, clone sources) where clone
+        sources maps fresh bookmarks of other users to the link cloning them,
+        links changed since the last upload are updated on the stored ones"""
+        if bookmarks_links is None:
+            bookmarks_links = self.bookmarks_links
+
+        # remove duplication from bookmarks (unique on normalized url)
+        new_bookmarks_map = {url_key(b["url"]): b for b in bookmarks_links}
+
+        # get only new bookmarks for this user (dedup happens in database)
+        new_keys = self.user.bookmarks.all().new_url_keys(new_bookmarks_map.keys())
+        new_keys = set(new_keys)
+
+        # stored already, renamed or moved to other folders
+        key_length = controllers.BookmarksManifest.KEY_LENGTH
+        changed_links = {
+            key: b
+            for key, b in new_bookmarks_map.items()
+            if key not in new_keys and key[:key_length] in self.changed_keys
+        }
+        if changed_links:
+            self.update_changed_bookmarks(changed_links)
 
         # clone from other users if any of those
         # bookmarks are exist and fresh to save time
-        # others_bookmarks = (
-        #     Bookmark.objects
-        #     .exclude(user=self.user)
-        #     .filter(
-        #         url__in=new_urls,
-        #         process_status__gte=Bookmark.ProcessStatus.TEXT_PROCESSED.value,
-        #         # TODO created in last 100 day disabled for now
-        #         # scrapes__created_at__gte=timezone.now() - timedelta(days=100)
-        #     )
-        #     .values('url', 'id')
-        #     .distinct('url')
-        # )
-        # others_bookmarks_urls = set(
-        #     others_bookmarks.values_list('url', flat=True))
-
-        # new_urls -= others_bookmarks_urls
-
-        # clone bookmarks
-        # others_ids = []
-        # more_data_for_clone = []
-        # for others_bookmark in others_bookmarks:
-        #     others_ids.append(others_bookmark['id'])
-        #     more_data_for_clone.append(new_bookmarks_map[others_bookmark['url']])
-
-        # tasks.deep_clone_bookmarks_task(
-        #     others_ids, self.user.id, self.id, more_data_for_clone)
-        return list({url: new_bookmarks_map[url] for url in new_urls}.values())
+        others_bookmarks = Bookmark.objects.all().clone_sources(self.user, new_keys)
+        new_keys -= others_bookmarks.keys()
+        clone_sources = {
+            source_id: new_bookmarks_map[key]
+            for key, source_id in others_bookmarks.items()
+        }
+
+        links = [b for key, b in new_bookmarks_map.items() if key in new_keys]
+        return links, clone_sources
 
     def init_bookmark(self, data):
         url = data.pop("url")
@@ -161,7 +316,7 @@ class BookmarkFile(models.Model):
 
         data = data or {}
 
-        return Bookmark(
+        bookmark = Bookmark(
             user=self.user,
             parent_file=self,
             url=url,
@@ -169,6 +324,119 @@ class BookmarkFile(models.Model):
             more_data=data,
             added_at=added_at,
         )
+        bookmark.set_url_fields()
+
+        return bookmark
+
+
+class BookmarkFileUpload(models.Model):
+    """Resumable upload of a big bookmarks file, chunks are appended to a
+    part file on disk by offset then finalized into a `BookmarkFile`
+    ON_FINALIZE
+        - hash the part file and reuse the user file if it is a duplicate
+        - or move the part file into a new `BookmarkFile` (normal flow)
+    ACTIONS
+        - only owner can make CRUD operations
+    """
+
+    UPLOAD_DIR = "users/uploads/"
+    CHUNK_MAX_SIZE = 4 * 1024 * 1024  # 4MB per request
+    EXPIRE_AFTER = timedelta(days=1)
+
+    # Relations
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="bookmark_file_uploads"
+    )
+    bookmark_file = models.ForeignKey(
+        BookmarkFile,
+        on_delete=models.SET_NULL,
+        related_name="uploads",
+        blank=True,
+        null=True,
+    )
+
+    # Required
+    uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    filename = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+
+    # Defaults
+    offset = models.PositiveBigIntegerField(default=0)
+
+    # Timing
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.total_size})"
+
+    def delete(self, *args, **kwargs):
+        self.remove_part_file()
+        return super().delete(*args, **kwargs)
+
+    # Computed
+    @property
+    def part_path(self) -> str:
+        return os.path.join(settings.MEDIA_ROOT, self.UPLOAD_DIR, f"{self.uuid}.part")
+
+    @property
+    def is_complete(self) -> bool:
+        return self.offset == self.total_size
+
+    def remove_part_file(self):
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+
+    def append_chunk(self, data: bytes):
+        """Write the chunk at the current offset, call it while the row is
+        locked (`select_for_update`) so chunks are not written concurrently"""
+        if self.offset + len(data) > self.total_size:
+            raise ValidationError("Chunk exceeds the upload total size")
+
+        os.makedirs(os.path.dirname(self.part_path), exist_ok=True)
+        mode = "r+b" if os.path.exists(self.part_path) else "wb"
+        with open(self.part_path, mode) as f:
+            # drop any bytes written by a request that failed before saving
+            f.seek(self.offset)
+            f.truncate()
+            f.write(data)
+
+        self.offset += len(data)
+        self.save(update_fields=["offset", "updated_at"])
+
+    def finalize(self) -> tuple[BookmarkFile, bool]:
+        """Create the bookmark file from the uploaded chunks,
+        return (bookmark_file, created)"""
+        if not self.is_complete:
+            raise ValidationError("Upload is not complete")
+
+        if self.bookmark_file is not None:
+            return self.bookmark_file, False
+
+        # hash and sniff in one read of the part file
+        hasher, head = hashlib.sha256(), b""
+        with open(self.part_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+                head = head or chunk[:4096]
+        file_hash = hasher.hexdigest()
+
+        created = False
+        bookmark_file = self.user.bookmark_files.filter(file_hash=file_hash).first()
+        if bookmark_file is None:
+            with open(self.part_path, "rb") as f:
+                location = MovableFile(f, name=self.filename)
+                location.file_hash, location.head = file_hash, head
+
+                bookmark_file = BookmarkFile(user=self.user, location=location)
+                bookmark_file.save()
+            created = True
+
+        self.remove_part_file()
+        self.bookmark_file = bookmark_file
+        self.save(update_fields=["bookmark_file", "updated_at"])
+
+        return bookmark_file, created
 
 
 class Bookmark(models.Model):
@@ -180,6 +448,7 @@ class Bookmark(models.Model):
     """
 
     ProcessStatus = choices.BookmarkProcessStatusChoices
+    CLONE_FRESHNESS = timedelta(days=100)  # other users bookmarks to clone from
 
     # Relations
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="bookmarks")
@@ -211,6 +480,14 @@ class Bookmark(models.Model):
         db_index=True,
     )
 
+    # Computed from url on save
+    url_key = models.CharField(
+        max_length=32, blank=True, null=True, editable=False, db_index=True
+    )
+    domain = models.CharField(
+        max_length=255, blank=True, null=True, editable=False, db_index=True
+    )
+
     # Optionals
     title = models.CharField(max_length=2048, blank=True, null=True)
     more_data = models.JSONField(blank=True, null=True)
@@ -238,25 +515,21 @@ class Bookmark(models.Model):
     all_objects = managers.AllBookmarkManager()
 
     class Meta:
-        indexes = [GinIndex(fields=["search_vector"])]
+        indexes = [
+            GinIndex(fields=["search_vector"]),
+            models.Index(fields=["user", "url_key"]),
+        ]
 
     def __str__(self) -> str:
         return f"{self.id} - {self.url}"
 
-    # Computed
-    @property
-    def domain(self) -> str:
-        # domain with subdomains
-        url = urllib3.util.parse_url(self.url)
-        # return '.'.join(url.host.split('.')[-2:])
-        host = url.host
-        if host.startswith("www."):
-            host = host[4:]
-        elif host.startswith("m.facebook"):
-            host = host[2:]
-
-        return host
+    def save(self, *args, **kwargs):
+        if kwargs.get("update_fields") is None:
+            self.set_url_fields()
+
+        return super().save(*args, **kwargs)
 
+    # Computed
     @property
     def site_name(self) -> str:
         return self.domain.split(".")[-2]
@@ -277,6 +550,10 @@ class Bookmark(models.Model):
 
     # methods
 
+    def set_url_fields(self):
+        self.url_key = url_key(self.url)
+        self.domain = url_domain(self.url)
+
     def set_image_from_url(self, url: str, new_width: int = 300):
         url = url_builder(url, self.domain)
         try:
@@ -301,58 +578,149 @@ class Bookmark(models.Model):
         self.image.save(file_name, image, save=True)
         self.save(update_fields=["image_url"])
 
-    def deep_clone(self, user, parent_file=None, **kwargs):
-        """Clone bookmark with all relations for new user
+    @classmethod
+    def bulk_deep_clone(cls, parent_file: BookmarkFile, sources: dict) -> list[int]:
+        """Clone bookmarks of other users with all relations in a fixed number
+        of `INSERT ... SELECT` statements whatever the number of bookmarks
         relations are ->
-            - webpages -> meta tags / headers
-            - tags
+            - website (resolved for the new user)
+            - latest webpage -> meta tags / headers
 
-        new parameters ->
-            - user
-            - parent file
+        `sources` maps each source bookmark id to the new link data
+        (url, title, added_at, ...) as parsed from the bookmarks file
 
-        update field ->
-            - status to PENDING
+        only the page data (webpage, image) is shared, title and more_data
+        (folders, icon) are the new user ones, never the source user ones
+
+        new bookmarks have status CLONED and skip crawling
         """
-        with transaction.atomic():
-            new_bookmark = clone(self, uuid=uuid.uuid4().hex)
-            new_bookmark.user = user
-            new_bookmark.parent_file = parent_file
-
-            new_bookmark.favorite = False
-            new_bookmark.hidden = False
-            new_bookmark.delete_scheduled_at = None
-            new_bookmark.added_at = None
-
-            for k, v in kwargs.items():
-                setattr(new_bookmark, k, v)
-
-            new_bookmark.save()
-            new_bookmark.update_process_status(self.ProcessStatus.CLONED.value)
-
-            if self.webpage:
-                new_webpage = clone(self.webpage)
-                new_webpage.bookmark = new_bookmark
-                new_webpage.save(update_fields=["bookmark"])
-
-                bulk_clone(self.webpage.meta_tags.all(), {"webpage": new_webpage})
-                bulk_clone(self.webpage.headers.all(), {"webpage": new_webpage})
-
-            if self.website and self.webpage:
-                new_website, _ = Website.objects.get_or_create(
-                    user=user,
-                    domain=self.website.domain,
-                    defaults={"favicon": self.website.favicon},
-                )
-                new_bookmark.website = new_website
-                new_webpage.save(update_fields=["website"])
+        if not sources:
+            return []
+
+        user = parent_file.user
+        source_rows = cls.objects.filter(id__in=sources).values_list(
+            "id", "url", "domain", "website__favicon"
+        )
+
+        # websites of the new user, favicon comes from the source website
+        favicons, source_domains, new_bookmarks = {}, {}, {}
+        for source_id, url, domain, favicon in source_rows:
+            source_domains[source_id] = domain
+            if favicons.get(domain) is None:
+                favicons[domain] = favicon
+
+            data = {"url": url, **sources[source_id]}
+            new_bookmarks[source_id] = parent_file.init_bookmark(data)
+
+        websites = Website.objects.all().resolve(user, favicons)
+
+        source_ids = list(new_bookmarks.keys())
+        bookmarks = list(new_bookmarks.values())
+
+        bookmark_table = cls._meta.db_table
+        webpage_table = BookmarkWebpage._meta.db_table
+        meta_tag_table = WebpageMetaTag._meta.db_table
+        header_table = WebpageHeader._meta.db_table
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO "{bookmark_table}" ('
+                '  "user_id", "parent_file_id", "website_id", "url", "url_key",'
+                '  "domain", "uuid", "title", "more_data", "image", "image_url",'
+                '  "process_status", "favorite", "hidden", "added_at",'
+                '  "created_at", "updated_at"'
+                ") "
+                "SELECT %s, %s, i.website_id, i.url, src.url_key, src.domain,"
+                "  i.uuid::uuid, i.title, COALESCE(i.more_data::jsonb, '{}'::jsonb),"
+                "  src.image,"
+                "  src.image_url, %s, false, false, i.added_at::timestamptz,"
+                "  now(), now() "
+                "FROM unnest("
+                "  %s::bigint[], %s::bigint[], %s::text[], %s::text[],"
+                "  %s::text[], %s::text[], %s::text[]"
+                ") AS i(source_id, website_id, url, uuid, title, more_data, added_at) "
+                f'JOIN "{bookmark_table}" src ON src.id = i.source_id '
+                'RETURNING "id", "uuid"',
+                [
+                    user.id,
+                    parent_file.id,
+                    cls.ProcessStatus.CLONED.value,
+                    source_ids,
+                    [websites.get(source_domains.get(i)) for i in source_ids],
+                    [b.url for b in bookmarks],
+                    [str(b.uuid) for b in bookmarks],
+                    [b.title for b in bookmarks],
+                    [
+                        json.dumps(b.more_data) if b.more_data else None
+                        for b in bookmarks
+                    ],
+                    [b.added_at and b.added_at.isoformat() for b in bookmarks],
+                ],
+            )
+            new_ids = {str(uuid_): id_ for id_, uuid_ in cursor.fetchall()}
+            new_ids = {
+                source_id: new_ids[str(bookmark.uuid)]
+                for source_id, bookmark in new_bookmarks.items()
+            }
 
-        return new_bookmark
+            # latest webpage of each source bookmark
+            source_webpages = dict(
+                BookmarkWebpage.objects.filter(bookmark_id__in=source_ids)
+                .order_by("bookmark_id", "-id")
+                .distinct("bookmark_id")
+                .values_list("bookmark_id", "id")
+            )
+
+            cursor.execute(
+                f'INSERT INTO "{webpage_table}" '
+                '("bookmark_id", "title", "etag", "last_modified", "content_hash",'
+                ' "created_at", "updated_at") '
+                "SELECT i.bookmark_id, w.title, w.etag, w.last_modified,"
+                " w.content_hash, now(), now() "
+                "FROM unnest(%s::bigint[], %s::bigint[]) AS i(bookmark_id, webpage_id) "
+                f'JOIN "{webpage_table}" w ON w.id = i.webpage_id '
+                'RETURNING "id", "bookmark_id"',
+                [
+                    [new_ids[source_id] for source_id in source_webpages],
+                    list(source_webpages.values()),
+                ],
+            )
+            new_webpages = dict((b, w) for w, b in cursor.fetchall())
+
+            webpages_map = [
+                list(source_webpages.values()),
+                [new_webpages[new_ids[source_id]] for source_id in source_webpages],
+            ]
+            cursor.execute(
+                f'INSERT INTO "{meta_tag_table}" '
+                '("webpage_id", "name", "content", "attrs", "created_at", '
+                '"updated_at") '
+                "SELECT i.new_id, t.name, t.content, t.attrs, now(), now() "
+                "FROM unnest(%s::bigint[], %s::bigint[]) AS i(old_id, new_id) "
+                f'JOIN "{meta_tag_table}" t ON t.webpage_id = i.old_id',
+                webpages_map,
+            )
+            cursor.execute(
+                f'INSERT INTO "{header_table}" '
+                '("webpage_id", "text", "level", "created_at", "updated_at") '
+                "SELECT i.new_id, h.text, h.level, now(), now() "
+                "FROM unnest(%s::bigint[], %s::bigint[]) AS i(old_id, new_id) "
+                f'JOIN "{header_table}" h ON h.webpage_id = i.old_id',
+                webpages_map,
+            )
+
+        cloned_ids = list(new_ids.values())
+        RedisPubSub.pub_bookmarks_change(
+            user.id, cloned_ids, cls.ProcessStatus.CLONED.value
+        )
+
+        return cloned_ids
 
     def update_process_status(self, new_status):
         if self.process_status >= new_status:
             return
 
+        previous_status = self.process_status
         self.process_status = new_status
         self.save(update_fields=["process_status"])
 
@@ -362,6 +730,7 @@ class Bookmark(models.Model):
                 "user_id": self.user.id,
                 "bookmark_id": self.id,
                 "status": new_status,
+                "previous_status": previous_status,
             }
         )
 
@@ -387,6 +756,8 @@ class Website(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = managers.WebsiteManager()
+
     class Meta:
         ordering = ["-created_at"]
         unique_together = ("user", "domain")
@@ -446,10 +817,17 @@ class BookmarkWebpage(models.Model):
     # Required
     title = models.CharField(max_length=2048)
 
+    # Optional, validators of the crawled response for conditional re-crawls
+    etag = models.TextField(blank=True, null=True)
+    last_modified = models.CharField(max_length=64, blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, null=True)
+
     # Timing
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    VALIDATORS = ["etag", "last_modified", "content_hash"]
+
     def __str__(self):
         return f"{self.id} - {self.title}"
 
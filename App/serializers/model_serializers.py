@@ -1,10 +1,13 @@
 from functools import wraps
 
 from django.core.cache import cache
+from django.core.files import File
+from django.core.validators import FileExtensionValidator
 from django.urls import reverse
 from rest_framework import serializers
 
 from App import models
+from common.utils.file_utils import strip_compression_extension
 
 
 def cache_serializer(timeout=60 * 60 * 24 * 3):  # 3 days
@@ -27,10 +30,55 @@ def cache_serializer(timeout=60 * 60 * 24 * 3):  # 3 days
 class BookmarkFileSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.BookmarkFile
-        fields = "__all__"
+        exclude = ["manifest"]  # one entry per link, can be megabytes
         extra_kwargs = {"user": {"read_only": True}}
 
 
+class BookmarkFileBatchSerializer(serializers.Serializer):
+    MAX_FILES = 10
+
+    location = serializers.ListField(
+        child=serializers.FileField(
+            validators=models.BookmarkFile._meta.get_field("location").validators
+        ),
+        min_length=1,
+        max_length=MAX_FILES,
+    )
+
+    def create(self, validated_data):
+        return models.BookmarkFile.create_batch(
+            validated_data["user"], validated_data["location"]
+        )
+
+
+class BookmarkFileUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.BookmarkFileUpload
+        fields = [
+            "uuid",
+            "filename",
+            "total_size",
+            "offset",
+            "bookmark_file",
+            "created_at",
+        ]
+        read_only_fields = ["offset", "bookmark_file"]
+
+    def validate_filename(self, value):
+        name = strip_compression_extension(value)
+        validator = FileExtensionValidator(models.BookmarkFile.CONTENT_EXTENSIONS)
+        validator(File(None, name=name))
+        return value
+
+    def validate_total_size(self, value):
+        max_size = models.BookmarkFile.MAX_SIZE_MB * 1024 * 1024
+        if value > max_size:
+            raise serializers.ValidationError(
+                f"File size should not exceed {models.BookmarkFile.MAX_SIZE_MB}MB."
+            )
+        return value
+
+
 class ScrapyResponseLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.ScrapyResponseLog
@@ -151,3 +199,9 @@ class BookmarkSerializer(serializers.ModelSerializer):
         class Meta:
             model = models.Bookmark
             fields = ["favorite", "hidden"]
+
+    class BookmarkCreate(serializers.ModelSerializer):
+        class Meta:
+            model = models.Bookmark
+            fields = ["id", "uuid", "url", "title", "favorite", "process_status"]
+            read_only_fields = ["process_status"]
@@ -8,7 +8,8 @@ from realtime.common.redis_utils import RedisPubSub
 
 @receiver(post_save, sender=models.BookmarkFile)
 def on_create_bookmark_file_extract_urls(sender, instance, created, **kwargs):
-    if not created:
+    # batched files are ingested together by `store_bookmarks_batch_task`
+    if not created or instance.batched:
         return
 
     def event():
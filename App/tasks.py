@@ -2,9 +2,10 @@ import json
 import logging
 import subprocess
 import typing
+from itertools import groupby
+from operator import itemgetter
 
 from celery import chord, current_app, shared_task
-from celery.result import allow_join_result
 from celery.signals import after_task_publish
 from django.contrib.auth import get_user_model
 from django.contrib.postgres.search import SearchVector
@@ -12,15 +13,16 @@ from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
 
-from App import models
-from common.utils.array_utils import window_list
+from App import controllers, models
+from common.utils.array_utils import window_iter, window_list
 from common.utils.html_utils import extract_image_from_meta
-from common.utils.time_utils import fromtimestamp
 from realtime.common.redis_utils import RedisPubSub
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
+CRAWL_PROCESS_BATCH_SIZE = 30  # bookmarks of one scrapy process (no service)
+
 
 def group_bookmarks_by_hook(
     bookmarks, hook_name
@@ -53,89 +55,210 @@ def update_sent_state(sender=None, headers=None, **kwargs):
     backend.store_result(headers["id"], None, "SENT")
 
 
+def pub_finish_if_done(user_id: int) -> None:
+    if not models.Bookmark.objects.filter(user_id=user_id).processing().exists():
+        RedisPubSub.pub({"type": RedisPubSub.MessageTypes.FINISH, "user_id": user_id})
+
+
+def store_bookmarks_chunk(parent, bookmarks_data: list[dict]) -> list:
+    bookmarks = list(map(parent.init_bookmark, bookmarks_data))
+
+    # one favicon per domain, the first bookmark having an icon wins
+    favicons = {}
+    for b in bookmarks:
+        if favicons.get(b.domain) is None:
+            favicons[b.domain] = b.more_data.get("icon")
+
+    websites = models.Website.objects.all().resolve(parent.user, favicons)
+    for b in bookmarks:
+        b.website_id = websites.get(b.domain)
+
+    return models.Bookmark.objects.all().copy_create(bookmarks)
+
+
+def iter_merged_bookmarks_links(parents: list) -> typing.Generator[tuple, None, None]:
+    """Changed links of many files as one stream of (parent, link), a url
+    found in many files belongs to the first one only as links are deduped
+    against the stored bookmarks of the user chunk by chunk"""
+    for parent in parents:
+        for link in parent.iter_changed_bookmarks_links():
+            yield parent, link
+
+
+def store_bookmark_files(parents: list, chunk_size: int = 1000) -> int:
+    # parse -> dedup -> insert -> link website -> dispatch crawl, chunk by chunk
+    # so crawling starts while the rest of the files are still being stored
+    total = 0
+    links = iter_merged_bookmarks_links(parents)
+    for chunk in window_iter(links, chunk_size):
+        bookmark_ids = []
+        for parent, parent_links in groupby(chunk, key=itemgetter(0)):
+            bookmarks_links = [link for _, link in parent_links]
+            bookmarks_data, clone_sources = parent.cleaned_bookmarks_links(
+                bookmarks_links
+            )
+
+            # cloned now (not delayed) so next chunks see them as stored
+            if clone_sources:
+                deep_clone_bookmarks(parent, clone_sources)
+
+            if not bookmarks_data:
+                continue
+
+            RedisPubSub.pub(
+                {
+                    "type": RedisPubSub.MessageTypes.FILE_UPLOAD,
+                    "user_id": parent.user.id,
+                    "total_bookmarks": len(bookmarks_data),
+                }
+            )
+
+            bookmarks = store_bookmarks_chunk(parent, bookmarks_data)
+            bookmark_ids.extend(b.id for b in bookmarks)
+
+        if bookmark_ids:
+            batch_bookmarks_to_tasks.delay(bookmark_ids)
+
+        total += len(bookmark_ids)
+
+    # stored last so a failed import is fully processed again on re-upload,
+    # files of one batch are all diffed against the manifest before it
+    if parents:
+        models.BookmarkFile.hide_removed_bookmarks(parents)
+    for parent in parents:
+        parent.store_manifest()
+
+        if parent.invalid_items:
+            logger.warning(
+                f"BookmarkFile<{parent.id}> skipped {len(parent.invalid_items)} "
+                f"invalid items, first ones: {parent.invalid_items[:10]}"
+            )
+
+    # nothing new to crawl (all deduped, cloned or unchanged) means no chord
+    # callback to finish the upload
+    for user_id in {parent.user_id for parent in parents}:
+        pub_finish_if_done(user_id)
+
+    return total
+
+
 @shared_task(queue="orm")
 def store_bookmarks_task(parent_id: int):
     parent = models.BookmarkFile.objects.get(id=parent_id)
-    bookmarks_data = parent.cleaned_bookmarks_links()
+    total = store_bookmark_files([parent])
 
-    RedisPubSub.pub(
-        {
-            "type": RedisPubSub.MessageTypes.FILE_UPLOAD,
-            "user_id": parent.user.id,
-            "total_bookmarks": len(bookmarks_data),
-        }
+    return (
+        f"BookmarkFile<{parent_id}> [Created] {total} Bookmarks "
+        f"[Removed] {parent.removed_links_count} Bookmarks "
+        f"[Invalid] {len(parent.invalid_items)} Items "
+        f"[ChangedFolders] {parent.changed_folders}"
     )
 
-    bookmarks = tuple(map(parent.init_bookmark, bookmarks_data))
-    models.Bookmark.objects.bulk_create(bookmarks, batch_size=250)
 
-    # TODO refactor creating website and move it to another task
-    domains = {b.domain for b in bookmarks}
-    website_objects = [
-        models.Website(user=parent.user, domain=domain) for domain in domains
-    ]
-    models.Website.objects.bulk_create(
-        website_objects, batch_size=250, ignore_conflicts=True
-    )
+@shared_task(queue="orm")
+def store_bookmarks_batch_task(parent_ids: list[int]):
+    parents = models.BookmarkFile.objects.filter(id__in=parent_ids).order_by("id")
+    parents = list(parents.select_related("user"))
+    total = store_bookmark_files(parents)
 
-    # Add relation between bookmark and website & store favicon to website
-    website_relation_map = {
-        w.domain: w for w in parent.user.websites.filter(domain__in=domains)
-    }
-    websites = []
-    for b in bookmarks:
-        website = website_relation_map[b.domain]
-        b.website = website
-        website.favicon = b.more_data.get("icon")
-        websites.append(website)
+    return f"BookmarkFiles<{parent_ids}> [Created] {total} Bookmarks"
 
-    models.Website.objects.bulk_update(websites, ["favicon"], batch_size=250)
-    models.Bookmark.objects.bulk_update(bookmarks, ["website"], batch_size=250)
 
-    batch_bookmarks_to_tasks.delay([b.id for b in bookmarks])
+def buffer_bookmark_to_crawl(bookmark) -> None:
+    """Collect bookmarks added one by one into the user buffer, the window
+    is flushed as one crawl batch after `WINDOW_SECONDS` or once it is full"""
+    buffer = controllers.BookmarksBuffer(bookmark.user_id)
+    size = buffer.push(bookmark.id)
 
-    return f"BookmarkFile<{parent_id}> [Created] {len(bookmarks_data)} Bookmarks"
+    if size >= buffer.MAX_SIZE:
+        flush_bookmarks_buffer_task.delay(bookmark.user_id)
+    elif size == 1:
+        flush_bookmarks_buffer_task.apply_async(
+            args=(bookmark.user_id,), countdown=buffer.WINDOW_SECONDS
+        )
 
 
 @shared_task(queue="orm")
-def batch_bookmarks_to_tasks(bookmark_ids: list[int]):
-    batch_size = 30
+def flush_bookmarks_buffer_task(user_id: int):
+    # a full window may be flushed before its timer, then the timer finds
+    # the next window (flushed early) or nothing
+    bookmark_ids = controllers.BookmarksBuffer(user_id).pop_all()
+    if not bookmark_ids:
+        return f"[FlushBookmarksBuffer] User<{user_id}> (empty)"
 
+    RedisPubSub.pub(
+        {
+            "type": RedisPubSub.MessageTypes.FILE_UPLOAD,
+            "user_id": user_id,
+            "total_bookmarks": len(bookmark_ids),
+        }
+    )
+    batch_bookmarks_to_tasks(bookmark_ids)
+
+    return f"[FlushBookmarksBuffer] User<{user_id}> ({len(bookmark_ids)})"
+
+
+@shared_task(queue="orm")
+def batch_bookmarks_to_tasks(bookmark_ids: list[int]):
     bookmarks = models.Bookmark.objects.filter(id__in=bookmark_ids)
     batches = group_bookmarks_by_hook(bookmarks, "get_batch_method")
 
+    # one task per hook, crawling is balanced bookmark by bookmark between
+    # the crawler services by the frontier, without them between the workers
+    batch_size = None
+    if not controllers.CrawlFrontier().is_alive():
+        batch_size = CRAWL_PROCESS_BATCH_SIZE
+
     tasks = []
     for hook_method, hook_group in batches:
-        id_groups = window_list(hook_group, batch_size)
+        id_groups = window_list(hook_group, batch_size) if batch_size else [hook_group]
         tasks.extend([hook_method.s(group) for group in id_groups])
 
     callback = post_batch_bookmarks_task.s(bookmark_ids=bookmark_ids).set(queue="orm")
 
-    job = chord(tasks)(callback)
-    with allow_join_result():
-        job.get()
+    # Don't wait for the chord, many chunks of the same file are batched
+    # at once and waiting would block the orm workers the callback needs
+    chord(tasks)(callback)
 
     return f"[Batched ({len(bookmark_ids)})] {bookmark_ids}"
 
 
-@shared_task(queue="scrapy")
-def crawl_bookmarks_task(bookmark_ids: list[int]):
-    models.Bookmark.objects.filter(id__in=bookmark_ids).start_crawl()
+@shared_task(bind=True, queue="scrapy", max_retries=3)
+def crawl_bookmarks_task(self, bookmark_ids: list[int], batch_id: str = None):
+    frontier = controllers.CrawlFrontier()
+
+    if batch_id is None:
+        bookmarks = models.Bookmark.objects.filter(id__in=bookmark_ids)
+        bookmarks.start_crawl()
+
+        # no crawler service running, one process per window of the batch
+        if not frontier.is_alive():
+            for ids in window_list(bookmark_ids, CRAWL_PROCESS_BATCH_SIZE):
+                command = ["python", "manage.py", "crawl_bookmarks", json.dumps(ids)]
+                subprocess.run(command, capture_output=True, text=True, check=True)
+
+            return f"[Crawled ({len(bookmark_ids)})] {bookmark_ids}"
 
-    ids = json.dumps(bookmark_ids)
-    command = ["python", "manage.py", "crawl_bookmarks", ids]
-    subprocess.run(command, capture_output=True, text=True, check=True)
+        # the crawler services keep their engines running and share the frontier
+        batch_id = frontier.push(list(bookmarks.values_list("id", "url_key", "domain")))
+
+    # includes the wait in the frontier behind other batches
+    if not frontier.wait(batch_id, timeout=frontier.wait_timeout()):
+        # still queued, waited again (not pushed again) so the bookmarks are
+        # never marked crawled by the chord callback before they are
+        logger.warning(f"crawl_bookmarks_task({bookmark_ids}) timed out")
+        raise self.retry(kwargs={"batch_id": batch_id}, countdown=0)
 
     return f"[Crawled ({len(bookmark_ids)})] {bookmark_ids}"
 
 
 @shared_task(queue="orm")
-def store_webpage_task(bookmark_id, page_title, meta_tags, headers):
+def store_webpage_task(bookmark_id, page_title, meta_tags, headers, validators=None):
     with transaction.atomic():
         bookmark = models.Bookmark.objects.get(id=bookmark_id)
         # TODO make title way shorter
         webpage = models.BookmarkWebpage.objects.create(
-            bookmark=bookmark, title=page_title[:2048]
+            bookmark=bookmark, title=page_title[:2048], **(validators or {})
         )
         models.WebpageMetaTag.bulk_create(webpage, meta_tags)
         models.WebpageHeader.bulk_create(webpage, headers)
@@ -144,23 +267,32 @@ def store_webpage_task(bookmark_id, page_title, meta_tags, headers):
     return f"[StoreWebpage] Bookmark<{bookmark_id}> Meta<{len(meta_tags)}> Header<{len(headers)}>"  # noqa
 
 
+def deep_clone_bookmarks(parent, sources: dict) -> list[int]:
+    cloned_ids = models.Bookmark.bulk_deep_clone(parent, sources)
+
+    RedisPubSub.pub(
+        {
+            "type": RedisPubSub.MessageTypes.FILE_UPLOAD,
+            "user_id": parent.user_id,
+            "total_bookmarks": len(cloned_ids),
+        }
+    )
+    index_search_vector_task.delay(cloned_ids)
+    store_bookmark_file_analytics_task.delay(parent.id)
+
+    return cloned_ids
+
+
 @shared_task(queue="orm")
 def deep_clone_bookmarks_task(bookmark_ids, user_id, file_id, more_data=None):
     if more_data is None:
         more_data = []
-    bookmarks_file = models.BookmarkFile.objects.get(id=file_id)
-    bookmarks = models.Bookmark.objects.filter(id__in=bookmark_ids)
-    user = User.objects.get(pk=user_id)
+    bookmarks_file = models.BookmarkFile.objects.get(id=file_id, user_id=user_id)
 
-    id_to_more_data = dict(zip(bookmark_ids, more_data))
-    # TODO This is make too much operations in database so bulk doing them
-    for bookmark in bookmarks:
-        data = id_to_more_data[bookmark.id]
-        added_at = data.pop("added_at", None)
-        if added_at:
-            added_at = fromtimestamp(added_at)
+    sources = {i: {} for i in bookmark_ids}
+    sources.update(zip(bookmark_ids, more_data))
 
-        bookmark.deep_clone(user, bookmarks_file, added_at=added_at)
+    deep_clone_bookmarks(bookmarks_file, sources)
 
     return f"[DeepClone ({len(bookmark_ids)})] {bookmark_ids}"
 
@@ -241,12 +373,20 @@ def post_batch_bookmarks_task(callback_result=None, bookmark_ids=None):
 
     bookmarks.crawled()
 
-    parent = models.Bookmark.objects.get(id=bookmark_ids[0]).parent_file
-    user_id = parent.user.id
+    # bookmarks added one by one (buffered) have no parent file
+    owners = set(bookmarks.values_list("user_id", "parent_file_id"))
+    if not owners:
+        return f"[PostBatched ({len(bookmark_ids)})] (deleted)"
 
-    store_bookmark_file_analytics_task.delay(parent.id)
+    for parent_id in {parent_id for _, parent_id in owners if parent_id}:
+        store_bookmark_file_analytics_task.delay(parent_id)
+
+    user_id = next(iter(owners))[0]
     cluster_checker_task.delay(user_id=user_id, bookmark_ids=bookmark_ids)
 
+    # the last batch of the user, nothing is left to process
+    pub_finish_if_done(user_id)
+
     return f"[PostBatched ({len(bookmark_ids)})] {bookmark_ids}"
 
 
@@ -272,3 +412,15 @@ def delete_bookmarks_beat_task():
     bookmarks.delete()
 
     return f"[DeleteBookmarks {today}] ({len(bookmarks)})"
+
+
+@shared_task(queue="orm")
+def delete_expired_uploads_beat_task():
+    expired_at = timezone.now() - models.BookmarkFileUpload.EXPIRE_AFTER
+    uploads = models.BookmarkFileUpload.objects.filter(updated_at__lte=expired_at)
+
+    # one by one to remove the part files from disk
+    for upload in uploads:
+        upload.delete()
+
+    return f"[DeleteExpiredUploads {expired_at}] ({len(uploads)})"
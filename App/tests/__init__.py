@@ -2,3 +2,4 @@ from .apis_tests import *
 from .controllers_tests import *
 from .models_tests import *
 from .scrapy_tests import *
+from .tasks_tests import *
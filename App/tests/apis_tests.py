@@ -1,15 +1,17 @@
 import json
 import os
 from time import sleep
+from unittest import mock
 
 from celery.result import AsyncResult
 from django.urls import reverse
 from knox.models import AuthToken
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 
-from App import models
+from App import models, tasks
 from App.tests.models_tests import ObjFactory, disconnect_signals
+from realtime.common.redis_utils import RedisPubSub
 
 
 def knox_authorize(user, test_case):
@@ -60,6 +62,49 @@ class BookmarkFileAPITestCase(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_file_create_duplicate(self):
+        duplicate = ObjFactory.create_file("json")
+        files_count = self.model.objects.count()
+
+        endpoint = reverse("app:file-create")
+        response = self.client.post(endpoint, data={"location": duplicate})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["id"], self.file.pk)
+        self.assertEqual(self.model.objects.count(), files_count)
+
+    def test_file_create_session_auth(self):
+        # session csrf check reads the body before the view gets the files
+        client = APIClient(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        client.cookies["csrftoken"] = "a" * 32
+
+        endpoint = reverse("app:file-create")
+        data = {"location": ObjFactory.create_file("json", how_many=2)}
+        response = client.post(endpoint, data=data, HTTP_X_CSRFTOKEN="a" * 32)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        bookmark_file = self.user.bookmark_files.get(pk=response.json()["id"])
+        self.assertTrue(bookmark_file.file_hash)
+
+    def test_file_batch_create(self):
+        files_count = self.model.objects.count()
+        files = [
+            ObjFactory.create_file("html"),
+            ObjFactory.create_file("html"),  # same file twice in the batch
+            ObjFactory.create_file("json"),  # already uploaded
+        ]
+
+        endpoint = reverse("app:file-batch-create")
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(endpoint, data={"location": files})
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.json()), 2)
+        self.assertIn(self.file.pk, [f["id"] for f in response.json()])
+        self.assertEqual(self.model.objects.count(), files_count + 1)
+        self.assertEqual(len(callbacks), 1)  # one ingestion for the batch
+
 
 class BookmarkFileUploadAPITestCase(APITestCase):
     model = models.BookmarkFile
@@ -134,6 +179,99 @@ class BookmarkFileUploadAPITestCase(APITestCase):
         os.remove(file_path)
 
 
+class BookmarkFileChunkedUploadAPITestCase(APITestCase):
+    model = models.BookmarkFileUpload
+
+    def setUp(self) -> None:
+        user = ObjFactory.create_user(username="mhameho")
+        knox_authorize(user, self)
+
+        self.reconnect_signals = disconnect_signals(models.BookmarkFile)
+
+        self.user = user
+        self.content = ObjFactory.create_file("json", 5).read()
+
+    def tearDown(self) -> None:
+        self.reconnect_signals()
+
+    def put_chunk(self, upload_uuid, offset, data):
+        endpoint = reverse("app:file_upload-chunk", args=(upload_uuid,))
+        return self.client.put(
+            endpoint,
+            data=data,
+            content_type="application/octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_chunked_upload(self):
+        endpoint = reverse("app:file_upload-create")
+        data = {"filename": "bookmarks.json", "total_size": len(self.content)}
+        response = self.client.post(endpoint, data=data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        upload_uuid = response.json()["uuid"]
+
+        middle = len(self.content) // 2
+        response = self.put_chunk(upload_uuid, 0, self.content[:middle])
+        self.assertEqual(response.json()["offset"], middle)
+
+        # resending a chunk after reconnect
+        response = self.put_chunk(upload_uuid, 0, self.content[:middle])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.json()["offset"], middle)
+
+        response = self.put_chunk(upload_uuid, middle, self.content[middle:])
+        self.assertEqual(response.json()["offset"], len(self.content))
+
+        endpoint = reverse("app:file_upload-finalize", args=(upload_uuid,))
+        response = self.client.post(endpoint)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        bookmark_file = self.user.bookmark_files.get(pk=response.json()["id"])
+        self.assertEqual(len(bookmark_file.bookmarks_links), 5)
+        self.assertFalse(self.model.objects.filter(bookmark_file=None).exists())
+
+    def test_finalize_incomplete_upload(self):
+        upload = self.model.objects.create(
+            user=self.user, filename="bookmarks.json", total_size=len(self.content)
+        )
+
+        endpoint = reverse("app:file_upload-finalize", args=(upload.uuid,))
+        response = self.client.post(endpoint)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_chunk_too_large(self):
+        upload = self.model.objects.create(
+            user=self.user, filename="bookmarks.json", total_size=len(self.content)
+        )
+
+        # more than the upload size left
+        response = self.put_chunk(upload.uuid, 0, self.content + b" ")
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(response.json()["offset"], 0)
+
+        # more than a chunk, rejected by the parser
+        data = b" " * (self.model.CHUNK_MAX_SIZE + 1)
+        response = self.put_chunk(upload.uuid, 0, data)
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.offset, 0)
+
+    def test_finalize_invalid_file(self):
+        upload = self.model.objects.create(
+            user=self.user, filename="bookmarks.txt", total_size=len(self.content)
+        )
+        upload.append_chunk(self.content)
+
+        endpoint = reverse("app:file_upload-finalize", args=(upload.uuid,))
+        response = self.client.post(endpoint)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        upload.refresh_from_db()
+        self.assertIsNone(upload.bookmark_file)
+        upload.delete()
+
+
 class BookmarkAPITestCase(APITestCase):
     model = models.Bookmark
 
@@ -170,6 +308,42 @@ class BookmarkAPITestCase(APITestCase):
         response = self.client.get(endpoint)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_bookmark_create(self):
+        endpoint = reverse("app:bookmark-create")
+        data = {"url": "https://dev.to/koladev", "title": "koladev"}
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(endpoint, data=data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(callbacks), 1)
+
+        bookmark = self.user.bookmarks.get(pk=response.json()["id"])
+        self.assertIsNone(bookmark.parent_file)
+        self.assertEqual(bookmark.website.domain, bookmark.domain)
+
+        # counted as created by the progress like imported bookmarks
+        with mock.patch.object(
+            RedisPubSub, "pub_bookmarks_change"
+        ) as pub, mock.patch.object(tasks, "buffer_bookmark_to_crawl") as buffer:
+            callbacks[0]()
+        pub.assert_called_once_with(
+            self.user.id, [bookmark.pk], models.Bookmark.ProcessStatus.CREATED
+        )
+        buffer.assert_called_once_with(bookmark)
+
+        # sent again by the client
+        response = self.client.post(endpoint, data=data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["id"], bookmark.pk)
+
+    def test_bookmark_create_invalid_url(self):
+        endpoint = reverse("app:bookmark-create")
+
+        for url in [["https://dev.to/"], 10, "not url"]:
+            with self.subTest(url=url):
+                response = self.client.post(endpoint, data={"url": url}, format="json")
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class TagsMostWeightedListAPITestCase(APITestCase):
     model = models.Tag
@@ -1,6 +1,17 @@
+import json
+from unittest import mock
+
+import fakeredis
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
 
-from App.controllers import TextCleaner
+from App.controllers import (
+    BookmarkHTMLFileManager,
+    BookmarkJSONFileManager,
+    CrawlFrontier,
+    TextCleaner,
+)
 
 
 class TextCleanerTestCase(TestCase):
@@ -186,3 +197,227 @@ class TextCleanerTestCase(TestCase):
         c = TextCleaner(text)
         c.full_clean()
         # self.assertEqual(c.text, expected)
+
+
+class BookmarkHTMLFileManagerTestCase(TestCase):
+    def setUp(self) -> None:
+        content = """
+            <!DOCTYPE NETSCAPE-Bookmark-file-1>
+            <TITLE>Bookmarks</TITLE>
+            <H1>Bookmarks</H1>
+            <DL><p>
+                <DT><H3 ADD_DATE="1700000000">Dev</H3>
+                <DL><p>
+                    <DT><A HREF="https://github.com/" ADD_DATE="1700000000">GitHub</A>
+                    <DT><H3>Python</H3>
+                    <DL><p>
+                        <DT><A HREF="https://python.org/">Python &amp; co</A>
+                    </DL><p>
+                </DL><p>
+                <DT><A HREF="https://google.com/" ICON="data:image/png">Google</A>
+            </DL><p>
+        """
+        self.file = SimpleUploadedFile("test.html", content.encode("utf8"))
+
+    def test_iter_links_method(self):
+        manager = BookmarkHTMLFileManager(self.file)
+        manager.CHUNK_SIZE = 32  # make sure tags split between chunks work
+        links = list(manager.iter_links())
+
+        self.assertEqual(
+            [link["url"] for link in links],
+            ["https://github.com/", "https://python.org/", "https://google.com/"],
+        )
+        self.assertEqual(links[0]["title"], "GitHub")
+        self.assertEqual(links[0]["added_at"], "1700000000")
+        self.assertEqual(links[1]["title"], "Python & co")
+        self.assertEqual(links[2]["icon"], "data:image/png")
+
+    def test_iter_links_folders(self):
+        links = BookmarkHTMLFileManager(self.file).get_links()
+
+        self.assertEqual(links[0]["folders"], ["Dev"])
+        self.assertEqual(links[1]["folders"], ["Dev", "Python"])
+        self.assertEqual(links[2]["folders"], [])
+
+
+class BookmarkJSONFileManagerTestCase(TestCase):
+    def get_manager(self, data) -> BookmarkJSONFileManager:
+        content = data if isinstance(data, str) else json.dumps(data)
+        return BookmarkJSONFileManager(
+            SimpleUploadedFile("test.json", content.encode("utf8"))
+        )
+
+    def test_iter_links_method(self):
+        urls = ["https://github.com/", "https://www.python.org/doc/?q=1#top"]
+        manager = self.get_manager(urls)
+        manager.CHUNK_SIZE = 8  # make sure items split between chunks work
+
+        self.assertEqual(list(manager.iter_links()), [{"url": url} for url in urls])
+        self.assertEqual(manager.invalid_items, [])
+
+    def test_invalid_items_reported_by_index(self):
+        manager = self.get_manager(["https://github.com/", 10, "not url"])
+        manager.VALIDATION_CHUNK_SIZE = 2
+
+        self.assertEqual(manager.get_links(), [{"url": "https://github.com/"}])
+        self.assertEqual(
+            [(i["index"], i["item"]) for i in manager.invalid_items],
+            [(1, 10), (2, "not url")],
+        )
+
+    def test_validate_method(self):
+        self.assertTrue(self.get_manager([]).validate())
+
+        with self.assertRaises(ValidationError):
+            self.get_manager({"url": "https://github.com/"}).validate()
+
+        with self.assertRaises(ValidationError):
+            self.get_manager('["https://github.com/" "x"]').get_links()
+
+
+class CrawlFrontierTestCase(TestCase):
+    def setUp(self) -> None:
+        self.now = 1000.0
+        clock = mock.patch(
+            "App.controllers.crawl_frontier.time.time", side_effect=lambda: self.now
+        )
+        connection = mock.patch(
+            "App.controllers.crawl_frontier.get_redis_connection",
+            return_value=fakeredis.FakeRedis(),
+        )
+        for patch in [clock, connection]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.frontier = CrawlFrontier()
+        self.client = self.frontier.client
+
+    def push(self, *bookmarks) -> str:
+        return self.frontier.push(list(bookmarks))
+
+    def pop_ids(self, count: int = 10) -> list[int]:
+        return [e["id"] for e in self.frontier.pop(count)]
+
+    def bucket(self, domain: str) -> dict:
+        state = self.client.hgetall(self.frontier.domain_key("bucket", domain))
+        return {k.decode(): float(v) for k, v in state.items()}
+
+    def test_pop_interleaves_domains(self):
+        self.push((1, "a/1", "a"), (2, "a/2", "a"), (3, "a/3", "a"), (4, "b/1", "b"))
+
+        self.assertEqual(self.pop_ids(3), [1, 4, 2])
+        self.assertEqual(self.pop_ids(), [3])
+        self.assertEqual(self.pop_ids(), [])
+
+    def test_pop_rate_and_concurrency_limits(self):
+        bookmarks = [(i, f"a/{i}", "a") for i in range(10)]
+        self.push(*bookmarks)
+
+        # burst of tokens
+        entries = self.frontier.pop(10)
+        self.assertEqual(len(entries), self.frontier.DOMAIN_BURST)
+
+        # tokens refilled but all the slots are taken
+        self.now += 10
+        self.assertEqual(self.pop_ids(), [])
+
+        for entry in entries[:2]:
+            self.frontier.complete(entry, 200)
+        self.now += 1
+        self.assertEqual(len(self.pop_ids()), 2)
+
+    def test_followers(self):
+        first = self.push((1, "a/1", "a"))
+        second = self.push((2, "a/1", "a"), (3, "a/2", "a"))
+
+        # the same url is crawled once, the other bookmark follows it
+        entries = self.frontier.pop(10)
+        self.assertEqual([e["id"] for e in entries], [1, 3])
+
+        followers = self.frontier.complete(entries[0], 200)
+        self.assertEqual([f["id"] for f in followers], [2])
+        self.assertTrue(self.frontier.wait(first, timeout=1))
+
+        self.frontier.complete(entries[1], 200)
+        self.assertTrue(self.frontier.wait(second, timeout=1))
+
+    def test_requeue_followers(self):
+        self.push((1, "a/1", "a"))
+        batch_id = self.push((2, "a/1", "a"))
+
+        entry = self.frontier.pop(10)[0]
+        followers = self.frontier.complete(entry, 304, requeue_followers=True)
+        self.assertEqual(followers, [])
+
+        # crawled on its own
+        self.now += 1
+        entries = self.frontier.pop(10)
+        self.assertEqual([e["id"] for e in entries], [2])
+        self.frontier.complete(entries[0], 200)
+        self.assertTrue(self.frontier.wait(batch_id, timeout=1))
+
+    def test_backoff(self):
+        self.push((1, "a/1", "a"), (2, "a/2", "a"), (3, "a/3", "a"))
+        first, second, third = self.frontier.pop(10)
+        rate = self.frontier.DOMAIN_RATE
+
+        # no response keeps the rate
+        self.frontier.complete(first)
+        self.assertNotIn("rate", self.bucket("a"))
+
+        self.frontier.complete(second, 200)
+        self.assertEqual(
+            self.bucket("a")["rate"], rate + self.frontier.DOMAIN_RATE_STEP
+        )
+
+        self.push((4, "a/4", "a"))
+        self.frontier.complete(third, 429, retry_after=30)
+        self.assertEqual(self.bucket("a")["rate"], (rate + 0.1) / 2)
+
+        # Retry-After is honored
+        self.now += 29
+        self.assertEqual(self.pop_ids(), [])
+        self.now += 2
+        self.assertEqual(self.pop_ids(), [4])
+
+    def test_ttl(self):
+        batch_id = self.push((1, "a/1", "a"))
+        self.push((2, "a/1", "a"))
+        in_flight, followers = self.frontier.url_keys("a/1")
+
+        # waiting in the queue
+        queued_ttl = self.frontier.QUEUED_TTL
+        for key in [in_flight, followers, self.frontier.batch_key(batch_id)]:
+            self.assertGreater(self.client.ttl(key), queued_ttl - 10)
+
+        # released if the service crashes, the followers wait for the next one
+        self.frontier.pop(10)
+        self.assertLessEqual(self.client.ttl(in_flight), self.frontier.IN_FLIGHT_TTL)
+        self.assertGreater(self.client.ttl(followers), queued_ttl - 10)
+
+    def test_requeue_expired_lease(self):
+        batch_id = self.push((1, "a/1", "a"), (2, "a/2", "a"))
+        self.push((3, "a/1", "a"))
+        lost, kept = self.frontier.pop(10)
+
+        # the service crashed before reporting the first entry
+        self.frontier.complete(kept, 200)
+        self.now += self.frontier.IN_FLIGHT_TTL + 1
+        self.assertEqual(self.frontier.requeue_expired(), 1)
+
+        # a late report of the requeued entry is not counted
+        self.assertEqual(self.frontier.complete(lost, 200), [])
+        self.assertFalse(self.frontier.wait(batch_id, timeout=1))
+
+        # crawled again, its follower waited for it
+        self.assertEqual(self.pop_ids(), [1])
+        followers = self.frontier.complete(lost, 200)
+        self.assertEqual([f["id"] for f in followers], [3])
+        self.assertTrue(self.frontier.wait(batch_id, timeout=1))
+
+    def test_wait_timeout(self):
+        self.push(*[(i, f"a/{i}", "a") for i in range(10)], (10, "b/1", "b"))
+
+        backlog = 10 / self.frontier.DOMAIN_RATE
+        self.assertEqual(self.frontier.wait_timeout(), self.frontier.MIN_WAIT + backlog)
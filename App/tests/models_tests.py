@@ -1,9 +1,11 @@
+import gzip
 import json
 import random
 import string
 from datetime import timedelta
 from time import sleep
 
+import zstandard
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -12,6 +14,7 @@ from django.dispatch import Signal
 from django.test import TestCase
 
 from App import models
+from common.utils.url_utils import url_key
 
 User = get_user_model()
 
@@ -91,7 +94,9 @@ class ObjFactory:
 
     @staticmethod
     def create_bookmark_webpage(bookmark, title, **kwargs):
-        return models.BookmarkWebpage.objects.create(bookmark=bookmark, title=title)
+        return models.BookmarkWebpage.objects.create(
+            bookmark=bookmark, title=title, **kwargs
+        )
 
     @staticmethod
     def create_dummy_bookmark_file(user):
@@ -158,6 +163,84 @@ class BookmarkFileTestCase(TestCase):
         self.assertIsInstance(self.json_obj.bookmarks_links[0], dict)
         self.assertIsInstance(self.json_obj.bookmarks_links[0].get("url"), str)
 
+    def test_compressed_file(self):
+        content = ObjFactory.create_file("json", 3).read()
+        cases = {
+            "gz": gzip.compress(content),
+            "zst": zstandard.ZstdCompressor().compress(content),
+        }
+
+        for ext, content in cases.items():
+            with self.subTest(ext):
+                location = SimpleUploadedFile(f"test_file.json.{ext}", content)
+                obj = ObjFactory.create_bookmark_file(user=self.user, location=location)
+
+                self.assertTrue(obj.is_json)
+                self.assertEqual(len(obj.bookmarks_links), 3)
+
+    def test_compressed_file_size_limit(self):
+        content = b"[" + b" " * (self.model.MAX_SIZE_MB * 1024 * 1024) + b"]"
+        location = SimpleUploadedFile("test_file.json.gz", gzip.compress(content))
+        obj = ObjFactory.create_bookmark_file(user=self.user, location=location)
+
+        # limited while parsing, the archive is never decompressed on upload
+        with self.assertRaises(ValidationError):
+            list(obj.iter_bookmarks_links())
+
+    def test_compressed_html_file_size_limit(self):
+        link = b'<DT><A HREF="https://github.com/">GitHub</A>'
+        content = link + b" " * (self.model.MAX_SIZE_MB * 1024 * 1024)
+        location = SimpleUploadedFile("test_file.html.gz", gzip.compress(content))
+        obj = ObjFactory.create_bookmark_file(user=self.user, location=location)
+
+        # rejected before the first link is read
+        with self.assertRaises(ValidationError):
+            next(obj.iter_bookmarks_links())
+
+    def test_iter_changed_bookmarks_links_method(self):
+        def upload(urls):
+            content = json.dumps(urls).encode("utf8")
+            location = SimpleUploadedFile("test_file.json", content)
+            bookmark_file = ObjFactory.create_bookmark_file(self.user, location)
+
+            links = list(bookmark_file.iter_changed_bookmarks_links())
+            bookmark_file.store_manifest()
+            return bookmark_file, [link["url"] for link in links]
+
+        old_urls = ["https://a.com/", "https://b.com/", "https://c.com/"]
+        old_file, links = upload(old_urls)
+        self.assertEqual(links, old_urls)
+        self.assertEqual(old_file.removed_links_count, 0)
+
+        new_file, links = upload(["https://a.com/", "https://d.com/", "https://c.com/"])
+        self.assertEqual(links, ["https://d.com/"])
+        self.assertEqual(new_file.removed_links_count, 1)
+
+        new_file.refresh_from_db()
+        self.assertEqual(len(new_file.manifest["links"]), 3)
+
+        # invalid items are kept to be reported
+        invalid_file, links = upload(["https://e.com/", 10, "not url"])
+        self.assertEqual(links, ["https://e.com/"])
+        self.assertEqual([i["index"] for i in invalid_file.invalid_items], [1, 2])
+
+    def test_cleaned_bookmarks_links_method(self):
+        stored_url = "https://quotes.toscrape.com/"
+        new_url = "https://books.toscrape.com/"
+        ObjFactory.create_bookmark(user=self.user, url=stored_url)
+
+        links, clone_sources = self.json_obj.cleaned_bookmarks_links(
+            [{"url": stored_url}, {"url": new_url}, {"url": new_url}]
+        )
+        self.assertEqual(links, [{"url": new_url}])
+        self.assertEqual(clone_sources, {})
+
+        # other users bookmarks don't affect the dedup
+        other_user = ObjFactory.create_user("other_user")
+        other_file = ObjFactory.create_dummy_bookmark_file(other_user)
+        links, _ = other_file.cleaned_bookmarks_links([{"url": stored_url}])
+        self.assertEqual(links, [{"url": stored_url}])
+
 
 class BookmarkTestCase(TestCase):
     model = models.Bookmark
@@ -177,6 +260,84 @@ class BookmarkTestCase(TestCase):
     def test_domain_property(self):
         self.assertEqual(self.obj.domain, "quotes.toscrape.com")
 
+    def test_url_fields_set_on_save(self):
+        self.assertEqual(self.obj.url_key, url_key(self.url))
+
+    def test_url_fields_updated_on_save(self):
+        self.obj.url = "https://www.books.toscrape.com/"
+        self.obj.save()
+        self.assertEqual(self.obj.domain, "books.toscrape.com")
+        self.assertEqual(self.obj.url_key, url_key(self.obj.url))
+
+    def test_copy_create_queryset_method(self):
+        website = models.Website.objects.create(
+            user=self.user, domain="books.toscrape.com"
+        )
+        special_title = 'tab\there\nnew "line" \\N back\\slash \u0645'
+        more_data = {"icon": None, "folders": ["a\tb", "c\\d"], "n": [1, 2.5]}
+        bookmarks = [
+            models.Bookmark(
+                user=self.user,
+                url="https://books.toscrape.com/?q=a\tb",
+                title=special_title,
+                more_data=more_data,
+            ),
+            models.Bookmark(user=self.user, url="https://toscrape.com/", title=None),
+        ]
+
+        created = self.model.objects.all().copy_create(bookmarks)
+
+        self.assertTrue(all(b.pk for b in created))
+        first, second = self.model.objects.filter(pk__in=[b.pk for b in created])
+        first, second = sorted([first, second], key=lambda b: b.pk)
+
+        self.assertEqual(first.title, special_title)
+        self.assertEqual(first.url, "https://books.toscrape.com/?q=a\tb")
+        self.assertEqual(first.more_data, more_data)
+        self.assertEqual(first.website_id, website.id)  # resolved by domain
+        self.assertEqual(first.url_key, url_key(first.url))
+
+        self.assertIsNone(second.title)
+        self.assertIsNone(second.added_at)
+        self.assertIsNone(second.website_id)
+
+    def test_bulk_deep_clone_class_method(self):
+        webpage = ObjFactory.create_bookmark_webpage(self.obj, title="webpage")
+        webpage.meta_tags.create(name="keywords", content="one, two")
+        webpage.headers.create(text="header", level=1)
+
+        user = ObjFactory.create_user("cloner")
+        bookmark_file = ObjFactory.create_dummy_bookmark_file(user)
+        cloned_ids = self.model.bulk_deep_clone(
+            bookmark_file, {self.obj.id: {"url": self.url, "title": "my title"}}
+        )
+
+        self.assertEqual(len(cloned_ids), 1)
+        clone = user.bookmarks.get(id=cloned_ids[0])
+        self.assertEqual(clone.title, "my title")
+        self.assertEqual(clone.url_key, self.obj.url_key)
+        self.assertEqual(clone.process_status, self.model.ProcessStatus.CLONED)
+
+        clone_webpage = clone.webpages.get()
+        self.assertEqual(clone_webpage.meta_tags.count(), 1)
+        self.assertEqual(clone_webpage.headers.count(), 1)
+
+    def test_bulk_deep_clone_keeps_user_data(self):
+        self.model.objects.filter(id=self.obj.id).update(
+            title="source title", more_data={"folders": ["Private"], "icon": "x"}
+        )
+
+        user = ObjFactory.create_user("cloner")
+        bookmark_file = ObjFactory.create_dummy_bookmark_file(user)
+        cloned_ids = self.model.bulk_deep_clone(
+            bookmark_file, {self.obj.id: {"url": self.url}}
+        )
+
+        # nothing of the source user leaks to the clone
+        clone = user.bookmarks.get(id=cloned_ids[0])
+        self.assertIsNone(clone.title)
+        self.assertEqual(clone.more_data, {})
+
     def test_site_name_property(self):
         self.assertEqual(self.obj.site_name, "toscrape")
 
@@ -197,6 +358,35 @@ class BookmarkTestCase(TestCase):
         self.assertDictEqual(obj.more_data, {"more": "this is more data"})
 
 
+class WebsiteTestCase(TestCase):
+    model = models.Website
+
+    def setUp(self) -> None:
+        self.user = ObjFactory.create_user()
+
+    def test_resolve_method(self):
+        websites = self.model.objects.all().resolve(
+            self.user, {"github.com": "icon.png", "python.org": None}
+        )
+        self.assertEqual(set(websites), {"github.com", "python.org"})
+        self.assertEqual(
+            self.model.objects.get(id=websites["github.com"]).favicon, "icon.png"
+        )
+
+        # existing websites are reused and favicon kept when no new one
+        again = self.model.objects.all().resolve(
+            self.user, {"github.com": None, "python.org": "python.png"}
+        )
+        self.assertEqual(again, websites)
+        self.assertEqual(
+            self.model.objects.get(id=websites["github.com"]).favicon, "icon.png"
+        )
+        self.assertEqual(
+            self.model.objects.get(id=websites["python.org"]).favicon, "python.png"
+        )
+        self.assertEqual(self.user.websites.count(), 2)
+
+
 class ScrapyResponseLogTestCase(TestCase):
     model = models.ScrapyResponseLog
 
@@ -242,6 +432,18 @@ class BookmarkWebpageTestCase(TestCase):
             bookmark=self.bookmark, title=self.title
         )
 
+    def test_with_validators_queryset_method(self):
+        # validators of the latest webpage only
+        ObjFactory.create_bookmark_webpage(
+            bookmark=self.bookmark, title=self.title, etag='"v2"', content_hash="h2"
+        )
+        bookmarks = models.Bookmark.objects.filter(id=self.bookmark.id)
+        bookmark = bookmarks.with_validators().get()
+
+        self.assertEqual(bookmark.webpage_etag, '"v2"')
+        self.assertEqual(bookmark.webpage_content_hash, "h2")
+        self.assertIsNone(bookmark.webpage_last_modified)
+
     def tearDown(self) -> None:
         self.reconnect_signals()
         self.reconnect_signals_bm()
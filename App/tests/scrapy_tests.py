@@ -1,14 +1,20 @@
+import hashlib
 import json
 import sys
 import unittest
-from unittest import TestCase
+from unittest import TestCase, mock
 
+from asgiref.sync import async_to_sync
 from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.test import TestCase as DjangoTestCase
+from scrapy.http import HtmlResponse, Request
 
 from App import models
+from crawler.middlewares import LogResponseMiddleware
+from crawler.spiders.bookmark import BookmarkSpider
 
-from .models_tests import ObjFactory
+from .models_tests import ObjFactory, disconnect_signals
 
 current_file_name = "App.tests." + __file__.split("/")[-1].replace(".py", "")
 should_skip = current_file_name not in sys.argv
@@ -60,3 +66,80 @@ class BookmarkSpiderTestCase(TestCase):
         ids = [bm.id for bm in self.bookmarks]
         models.Bookmark.objects.filter(user=self.user, id__in=ids).delete()
         get_user_model().objects.filter(id=self.user.id).delete()
+
+
+class ConditionalCrawlTestCase(DjangoTestCase):
+    body = b"<html><head><title>Page</title></head></html>"
+
+    def setUp(self) -> None:
+        self.reconnect_signals = disconnect_signals(models.Bookmark)
+
+        user = ObjFactory.create_user()
+        bookmark = ObjFactory.create_bookmark(user, url="https://quotes.toscrape.com/")
+        ObjFactory.create_bookmark_webpage(
+            bookmark,
+            "Page",
+            etag='"v1"',
+            last_modified="Wed, 21 Oct 2015 07:28:00 GMT",
+            content_hash=hashlib.sha256(self.body).hexdigest(),
+        )
+        self.bookmark = models.Bookmark.objects.filter(
+            id=bookmark.id
+        ).with_validators()[0]
+
+    def tearDown(self) -> None:
+        self.reconnect_signals()
+
+    def get_response(self, status: int = 200, body: bytes = None) -> HtmlResponse:
+        request = BookmarkSpider([]).bookmark_request(self.bookmark)
+        return HtmlResponse(
+            self.bookmark.url,
+            status=status,
+            body=self.body if body is None else body,
+            request=request,
+        )
+
+    def process_response(self, response: HtmlResponse):
+        with mock.patch.object(models.ScrapyResponseLog, "store_file") as store_file:
+            async_to_sync(LogResponseMiddleware().process_response)(
+                response.request, response, None
+            )
+        return store_file
+
+    def test_conditional_request(self):
+        request = self.get_response().request
+        self.assertEqual(request.headers["If-None-Match"], b'"v1"')
+        self.assertEqual(
+            request.headers["If-Modified-Since"], b"Wed, 21 Oct 2015 07:28:00 GMT"
+        )
+
+    def test_not_modified(self):
+        response = self.get_response(status=304, body=b"")
+        store_file = self.process_response(response)
+
+        self.assertTrue(response.meta["unchanged"])
+        store_file.assert_not_called()
+        log = models.ScrapyResponseLog.objects.get(bookmark=self.bookmark)
+        self.assertEqual((log.status_code, log.error), (304, None))
+
+        # nothing to extract
+        self.assertEqual(list(BookmarkSpider([]).parse(response, self.bookmark)), [])
+
+    def test_unchanged_content(self):
+        response = self.get_response()
+        store_file = self.process_response(response)
+
+        self.assertTrue(response.meta["unchanged"])
+        store_file.assert_not_called()
+        self.assertEqual(list(BookmarkSpider([]).parse(response, self.bookmark)), [])
+
+    def test_changed_content(self):
+        body = b"<html><head><title>New</title></head></html>"
+        response = self.get_response(body=body)
+        store_file = self.process_response(response)
+
+        self.assertFalse(response.meta["unchanged"])
+        store_file.assert_called_once_with(body)
+
+        validators = BookmarkSpider.response_validators(response)
+        self.assertEqual(validators["content_hash"], hashlib.sha256(body).hexdigest())
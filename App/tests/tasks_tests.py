@@ -0,0 +1,201 @@
+import json
+from unittest import mock
+
+from celery.exceptions import Retry
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+
+from App import controllers, models, tasks
+from App.flows.instagram import InstagramBookmarkHooks
+from realtime.common.redis_utils import RedisPubSub
+
+from .models_tests import ObjFactory, disconnect_signals
+
+
+class StoreBookmarkFilesTestCase(TestCase):
+    def setUp(self) -> None:
+        self.reconnect_signals = disconnect_signals(models.BookmarkFile)
+        self.user = ObjFactory.create_user()
+
+    def tearDown(self) -> None:
+        self.reconnect_signals()
+
+    def create_file(self, urls: list[str]) -> models.BookmarkFile:
+        content = json.dumps(urls).encode("utf8")
+        location = SimpleUploadedFile("test_file.json", content)
+        return ObjFactory.create_bookmark_file(self.user, location)
+
+    @mock.patch.object(tasks.batch_bookmarks_to_tasks, "delay")
+    def test_store_bookmark_files_by_chunks(self, batch_delay):
+        urls = [
+            "https://a.com/",
+            "https://b.com/",
+            "https://a.com/",  # stored in the previous chunk
+            "https://c.com/",
+            "https://d.com/",
+        ]
+        parent = self.create_file(urls)
+
+        total = tasks.store_bookmark_files([parent], chunk_size=2)
+
+        self.assertEqual(total, 4)
+        self.assertEqual(parent.bookmarks.count(), 4)
+
+        # one crawl batch per chunk, with the bookmarks of that chunk only
+        batches = [call.args[0] for call in batch_delay.call_args_list]
+        batches_urls = [
+            sorted(
+                models.Bookmark.objects.filter(id__in=ids).values_list("url", flat=True)
+            )
+            for ids in batches
+        ]
+        self.assertEqual(
+            batches_urls,
+            [
+                ["https://a.com/", "https://b.com/"],
+                ["https://c.com/"],
+                ["https://d.com/"],
+            ],
+        )
+
+        parent.refresh_from_db()
+        self.assertEqual(len(parent.manifest["links"]), 4)
+
+    @mock.patch.object(tasks.batch_bookmarks_to_tasks, "delay")
+    def test_store_bookmark_files_dedup_across_files(self, batch_delay):
+        first = self.create_file(["https://a.com/", "https://b.com/"])
+        second = self.create_file(["https://b.com/", "https://c.com/", "https://a.com"])
+
+        total = tasks.store_bookmark_files([first, second], chunk_size=2)
+
+        # a url found in many files belongs to the first one only
+        self.assertEqual(total, 3)
+        self.assertEqual(first.bookmarks.count(), 2)
+        self.assertEqual(
+            list(second.bookmarks.values_list("url", flat=True)), ["https://c.com/"]
+        )
+
+    @mock.patch.object(tasks.batch_bookmarks_to_tasks, "delay")
+    def test_store_bookmark_files_reupload(self, batch_delay):
+        def upload(links: dict[str, str]) -> models.BookmarkFile:
+            anchors = "".join(
+                f'<DT><A HREF="{url}">{title}</A>' for url, title in links.items()
+            )
+            content = f"<!DOCTYPE NETSCAPE-Bookmark-file-1><DL><p>{anchors}</DL>"
+            location = SimpleUploadedFile("test_file.html", content.encode("utf8"))
+            parent = ObjFactory.create_bookmark_file(self.user, location)
+
+            tasks.store_bookmark_files([parent])
+            return parent
+
+        upload({"https://a.com/": "Old title", "https://b.com/": "B"})
+        parent = upload({"https://a.com/": "New title"})
+
+        # renamed on the stored bookmark, not created again
+        self.assertEqual(parent.bookmarks.count(), 0)
+        bookmark = models.Bookmark.objects.get(url="https://a.com/")
+        self.assertEqual(bookmark.title, "New title")
+
+        # removed from the library, hidden not deleted
+        self.assertEqual(parent.removed_links_count, 1)
+        self.assertEqual(
+            list(models.Bookmark.hidden_objects.values_list("url", flat=True)),
+            ["https://b.com/"],
+        )
+
+    @mock.patch.object(RedisPubSub, "pub")
+    @mock.patch.object(tasks.batch_bookmarks_to_tasks, "delay")
+    def test_store_bookmark_files_finish_without_new_bookmarks(self, batch_delay, pub):
+        ObjFactory.create_bookmark(self.user, url="https://a.com/")
+        models.Bookmark.objects.filter(user=self.user).crawled()
+        parent = self.create_file(["https://a.com/"])
+
+        total = tasks.store_bookmark_files([parent])
+
+        # nothing is crawled so no chord callback finishes the upload
+        self.assertEqual(total, 0)
+        batch_delay.assert_not_called()
+        pub.assert_called_with(
+            {"type": RedisPubSub.MessageTypes.FINISH, "user_id": self.user.id}
+        )
+
+
+class PostBatchBookmarksTestCase(TestCase):
+    def setUp(self) -> None:
+        self.reconnect_signals = disconnect_signals(models.Bookmark)
+        self.user = ObjFactory.create_user()
+
+    def tearDown(self) -> None:
+        self.reconnect_signals()
+
+    @mock.patch.object(tasks.cluster_checker_task, "delay")
+    @mock.patch.object(RedisPubSub, "pub")
+    def test_finish_published_after_last_batch(self, pub, _):
+        first, second = (
+            ObjFactory.create_bookmark(self.user, url=url)
+            for url in ["https://a.com/", "https://b.com/"]
+        )
+        finish = {"type": RedisPubSub.MessageTypes.FINISH, "user_id": self.user.id}
+
+        tasks.post_batch_bookmarks_task(bookmark_ids=[first.id])
+        self.assertNotIn(mock.call(finish), pub.call_args_list)
+
+        tasks.post_batch_bookmarks_task(bookmark_ids=[second.id])
+        pub.assert_called_with(finish)
+
+
+class CrawlBookmarksTestCase(TestCase):
+    def setUp(self) -> None:
+        self.reconnect_signals = disconnect_signals(models.Bookmark)
+        user = ObjFactory.create_user()
+        self.bookmark_ids = [
+            ObjFactory.create_bookmark(user, url=f"https://a.com/{i}").id
+            for i in range(3)
+        ]
+
+    def tearDown(self) -> None:
+        self.reconnect_signals()
+
+    @mock.patch.object(tasks, "CRAWL_PROCESS_BATCH_SIZE", 2)
+    @mock.patch.object(tasks.subprocess, "run")
+    @mock.patch.object(controllers.CrawlFrontier, "is_alive", return_value=False)
+    def test_crawl_without_service(self, _, run):
+        tasks.crawl_bookmarks_task(self.bookmark_ids)
+
+        # one scrapy process per window
+        crawled = [json.loads(call.args[0][-1]) for call in run.call_args_list]
+        self.assertEqual(crawled, [self.bookmark_ids[:2], self.bookmark_ids[2:]])
+
+    @mock.patch.object(tasks, "CRAWL_PROCESS_BATCH_SIZE", 2)
+    @mock.patch.object(tasks.crawl_bookmarks_task, "delay")
+    def test_instagram_post_batch(self, delay):
+        post_batch = InstagramBookmarkHooks(None).post_batch()
+
+        for alive, groups in [
+            (True, [self.bookmark_ids]),
+            (False, [self.bookmark_ids[:2], self.bookmark_ids[2:]]),
+        ]:
+            with self.subTest(alive=alive), mock.patch.object(
+                controllers.CrawlFrontier, "is_alive", return_value=alive
+            ):
+                delay.reset_mock()
+                post_batch(self.bookmark_ids)
+                self.assertEqual([c.args[0] for c in delay.call_args_list], groups)
+
+    @mock.patch.object(controllers.CrawlFrontier, "wait_timeout", return_value=1)
+    @mock.patch.object(controllers.CrawlFrontier, "wait", return_value=False)
+    @mock.patch.object(controllers.CrawlFrontier, "push", return_value="batch")
+    @mock.patch.object(controllers.CrawlFrontier, "is_alive", return_value=True)
+    def test_crawl_timeout(self, _, push, wait, __):
+        task = tasks.crawl_bookmarks_task
+        with mock.patch.object(task, "retry", side_effect=Retry()) as retry:
+            with self.assertRaises(Retry):
+                task(self.bookmark_ids)
+            retry.assert_called_once_with(kwargs={"batch_id": "batch"}, countdown=0)
+
+            # the same batch is waited again, never pushed twice
+            with self.assertRaises(Retry):
+                task(self.bookmark_ids, batch_id="batch")
+
+        push.assert_called_once()
+        self.assertEqual(wait.call_args_list, [mock.call("batch", timeout=1)] * 2)
@@ -6,6 +6,7 @@ from common.utils.drf.routers import CustomSuffixRouter
 router = CustomSuffixRouter()
 
 router.register(r"file", views.BookmarkFileAPI, basename="file")
+router.register(r"file-upload", views.BookmarkFileUploadAPI, basename="file_upload")
 router.register(r"bookmark", views.BookmarkAPI, basename="bookmark")
 router.register(r"tag", views.TagAPI, basename="tag")
 
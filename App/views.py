@@ -2,6 +2,8 @@ import math
 from datetime import timedelta
 
 from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.db.models import Count
 from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404
@@ -13,12 +15,16 @@ from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 
-from App import filters, models, serializers
+from App import filters, models, serializers, tasks
+from common.utils.django.upload_handlers import hashing_upload_handlers
 from common.utils.drf.filters import FullTextSearchFilter
+from common.utils.drf.parsers import BinaryParser
 from common.utils.drf.serializers import only_fields
-from common.utils.drf.viewsets import CRDLViewSet, RLViewSet, RUDLViewSet
+from common.utils.drf.viewsets import CRDLViewSet, CRUDLViewSet, RLViewSet
 from common.utils.math_utils import minmax
+from common.utils.url_utils import url_domain, url_key
 from realtime.common.jwt_utils import JwtManager
+from realtime.common.redis_utils import RedisPubSub
 
 
 def cache_per_user(timeout):
@@ -42,12 +48,33 @@ class BookmarkFileAPI(CRDLViewSet):
     parser_classes = (MultiPartParser, FormParser)
     serializer_class = serializers.BookmarkFileSerializer
 
+    def initialize_request(self, request, *args, **kwargs):
+        drf_request = super().initialize_request(request, *args, **kwargs)
+        if self.action in ["create", "batch_create"]:
+            # hash and sniff the file while it is streamed to disk, set before
+            # authentication as the session csrf check already reads the body
+            request.upload_handlers = hashing_upload_handlers(request)
+        return drf_request
+
     def create(self, request, *args, **kwargs):
-        response = super().create(request, *args, **kwargs)
+        # re-uploading same file returns the stored one without parsing it
+        if existing := self.get_existing_file(request.FILES.get("location")):
+            serializer = self.get_serializer(existing)
+            response = Response(serializer.data, status=status.HTTP_200_OK)
+        else:
+            response = super().create(request, *args, **kwargs)
+
         JwtManager.inject_cookie(response, data={"user_id": request.user.id})
 
         return response
 
+    def get_existing_file(self, uploaded_file):
+        file_hash = getattr(uploaded_file, "file_hash", None)
+        if file_hash is None:
+            return None
+
+        return self.get_queryset().filter(file_hash=file_hash).first()
+
     def get_queryset(self):
         if self.request.user.is_anonymous:
             return models.BookmarkFile.objects.none()
@@ -57,8 +84,108 @@ class BookmarkFileAPI(CRDLViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(methods=["post"], detail=False, url_path="batch-create")
+    def batch_create(self, request):
+        # many files ingested as one pipeline, links are deduped across files
+        serializer = serializers.BookmarkFileBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        bookmark_files = serializer.save(user=request.user)
+
+        serializer = self.get_serializer(bookmark_files, many=True)
+        response = Response(serializer.data, status=status.HTTP_201_CREATED)
+        JwtManager.inject_cookie(response, data={"user_id": request.user.id})
+
+        return response
+
+
+class ChunkParser(BinaryParser):
+    max_size = models.BookmarkFileUpload.CHUNK_MAX_SIZE
+
+
+class BookmarkFileUploadAPI(CRDLViewSet):
+    """Resumable upload of big files, each request carries one small chunk
+    ```
+    POST file-upload/create/ {"filename": "x.html.gz", "total_size": 1000}
+    PUT file-upload/<uuid>/chunk/ (Upload-Offset: 0) <raw bytes>
+    GET file-upload/<uuid>/ -> {"offset": 500, ...} resume from offset
+    POST file-upload/<uuid>/finalize/ -> the created bookmark file
+    ```
+    """
+
+    serializer_class = serializers.BookmarkFileUploadSerializer
+    lookup_field = "uuid"
+
+    def get_queryset(self):
+        if self.request.user.is_anonymous:
+            return models.BookmarkFileUpload.objects.none()
+
+        return self.request.user.bookmark_file_uploads.all()
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    @action(methods=["put"], detail=True, parser_classes=[ChunkParser])
+    def chunk(self, request, uuid):
+        data = request.data
+
+        try:
+            offset = int(request.headers["Upload-Offset"])
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "Upload-Offset header is required"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        with transaction.atomic():
+            upload = get_object_or_404(
+                self.get_queryset().select_for_update(), uuid=uuid
+            )
+
+            # client is out of sync (e.g. reconnected) it resumes from offset
+            if offset != upload.offset or upload.bookmark_file_id:
+                return Response(
+                    {"error": "Offset mismatch", "offset": upload.offset},
+                    status=status.HTTP_409_CONFLICT,
+                )
+
+            try:
+                upload.append_chunk(data)
+            except ValidationError as e:
+                return Response(
+                    {"error": e.messages, "offset": upload.offset},
+                    status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                )
+
+        return Response({"offset": upload.offset}, status=status.HTTP_200_OK)
+
+    @action(methods=["post"], detail=True)
+    def finalize(self, request, uuid):
+        try:
+            with transaction.atomic():
+                upload = get_object_or_404(
+                    self.get_queryset().select_for_update(), uuid=uuid
+                )
+                if not upload.is_complete:
+                    return Response(
+                        {"error": "Upload is not complete", "offset": upload.offset},
+                        status=status.HTTP_409_CONFLICT,
+                    )
+
+                bookmark_file, created = upload.finalize()
+        except ValidationError as e:  # the uploaded file is not valid
+            return Response({"error": e.messages}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = serializers.BookmarkFileSerializer(
+            bookmark_file, context=self.get_serializer_context()
+        )
+        response_status = status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        response = Response(serializer.data, status=response_status)
+        JwtManager.inject_cookie(response, data={"user_id": request.user.id})
+
+        return response
 
-class BookmarkAPI(RUDLViewSet):
+
+class BookmarkAPI(CRUDLViewSet):
     serializer_class = serializers.BookmarkSerializer
 
     filterset_class = filters.BookmarkFilter
@@ -85,6 +212,8 @@ class BookmarkAPI(RUDLViewSet):
 
         if self.action in ["update", "partial_update"]:
             serializer_class = serializers.BookmarkSerializer.BookmarkUpdate
+        elif self.action == "create":
+            serializer_class = serializers.BookmarkSerializer.BookmarkCreate
         elif self.action in list_actions:
             serializer_class = serializers.BookmarkSerializer.BookmarkDetails
 
@@ -125,6 +254,41 @@ class BookmarkAPI(RUDLViewSet):
             )
         return qs
 
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # live sync clients may resend the same bookmark, return the stored one,
+        # concurrent requests of the same url wait for each other
+        key = url_key(serializer.validated_data["url"])
+        with transaction.atomic():
+            models.Bookmark.objects.all().lock_url_key(request.user.id, key)
+            if existing := self.get_queryset().filter(url_key=key).first():
+                serializer = self.get_serializer(existing)
+                return Response(serializer.data, status=status.HTTP_200_OK)
+
+            self.perform_create(serializer)
+        headers = self.get_success_headers(serializer.data)
+        return Response(
+            serializer.data, status=status.HTTP_201_CREATED, headers=headers
+        )
+
+    def perform_create(self, serializer):
+        user = self.request.user
+        domain = url_domain(serializer.validated_data["url"])
+        websites = models.Website.objects.all().resolve(user, {domain: None})
+
+        bookmark = serializer.save(user=user, website_id=websites.get(domain))
+
+        # stored now, crawled with the other bookmarks of the same window
+        def event():
+            RedisPubSub.pub_bookmarks_change(
+                user.id, [bookmark.id], bookmark.process_status
+            )
+            tasks.buffer_bookmark_to_crawl(bookmark)
+
+        transaction.on_commit(event)
+
     def perform_destroy(self, instance):
         instance.hidden = True
         instance.delete_scheduled_at = timezone.now() + timedelta(days=14)
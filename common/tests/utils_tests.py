@@ -1,9 +1,13 @@
+import gzip
 import hashlib
+import io
 
+import zstandard
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.test import RequestFactory, TestCase, override_settings
 
-from common.utils import array_utils, file_utils, math_utils, string_utils
+from common.utils import array_utils, file_utils, math_utils, string_utils, url_utils
+from common.utils.django.upload_handlers import hashing_upload_handlers
 
 
 class UtilsTestCase(TestCase):
@@ -35,6 +39,21 @@ class UtilsTestCase(TestCase):
                 with self.assertRaises(ZeroDivisionError):
                     list(array_utils.window_list(data, size))
 
+    def test_window_iter(self):
+        cases = {
+            "normal_case_size_2": (iter([1, 2, 3, 4, 5]), 2, [[1, 2], [3, 4], [5]]),
+            "normal_case_generator": ((i for i in range(3)), 3, [[0, 1, 2]]),
+            "edge_case_empty_iterable": (iter([]), 10, []),
+        }
+
+        for name, (data, size, expected) in cases.items():
+            with self.subTest(name):
+                c = list(array_utils.window_iter(data, size))
+                self.assertEqual(c, expected)
+
+        with self.assertRaises(ZeroDivisionError):
+            list(array_utils.window_iter([1, 2], 0))
+
     def test_unique_dicts_in_list(self):
         cases = {
             "normal_case": (
@@ -81,6 +100,96 @@ class UtilsTestCase(TestCase):
                 c = file_utils.hash_file(file_)
                 self.assertEqual(c, expected)
 
+    def test_hashing_upload_handlers(self):
+        data = b"Hello, world!" * 1000
+        cases = {
+            "normal_case_memory": 10**6,
+            "normal_case_temporary_file": 100,
+        }
+
+        for name, max_memory_size in cases.items():
+            with self.subTest(name), override_settings(
+                FILE_UPLOAD_MAX_MEMORY_SIZE=max_memory_size
+            ):
+                request = RequestFactory().post("/", {"file": io.BytesIO(data)})
+                request.upload_handlers = hashing_upload_handlers(request)
+                uploaded_file = request.FILES["file"]
+
+                self.assertEqual(
+                    uploaded_file.file_hash, hashlib.sha256(data).hexdigest()
+                )
+                self.assertEqual(uploaded_file.head, data[:4096])
+                self.assertEqual(
+                    file_utils.hash_file(uploaded_file), uploaded_file.file_hash
+                )
+
+    def test_decompressed_file(self):
+        data = b'["https://example.com/"]' * 100
+        cases = {
+            "normal_case_gzip": ("gzip", gzip.compress(data)),
+            "normal_case_zstd": ("zstd", zstandard.ZstdCompressor().compress(data)),
+        }
+
+        for name, (compression, content) in cases.items():
+            with self.subTest(name):
+                file_ = io.BytesIO(content)
+                self.assertEqual(file_utils.file_compression(file_), compression)
+
+                stream = file_utils.DecompressedFile(file_, compression)
+                self.assertEqual(stream.read(10), data[:10])
+                stream.seek(0)
+                self.assertEqual(stream.read(), data)
+
+                stream = file_utils.DecompressedFile(file_, compression, max_size=10)
+                with self.assertRaises(file_utils.DecompressedSizeError):
+                    stream.read()
+
+        self.assertIsNone(file_utils.file_compression(io.BytesIO(data)))
+
+    def test_strip_compression_extension(self):
+        cases = {
+            "file.json.gz": "file.json",
+            "file.html.zst": "file.html",
+            "file.json_Ab12Cd3.gz": "file.json",
+            "file_name.json": "file_name.json",
+            "file.json": "file.json",
+        }
+        for name, expected in cases.items():
+            with self.subTest(name):
+                self.assertEqual(file_utils.strip_compression_extension(name), expected)
+
+    def test_iter_json_array(self):
+        def get_file(data):
+            return io.BytesIO(data.encode("utf8"))
+
+        cases = {
+            "normal_case": ('["a", "b"]', ["a", "b"]),
+            "normal_case_mixed_items": (
+                '[1.5e10, {"a": [1, 2]}, null, "\u0645"]',
+                [1.5e10, {"a": [1, 2]}, None, "\u0645"],
+            ),
+            "edge_case_empty_array": (" [ ] ", []),
+        }
+
+        for name, (data, expected) in cases.items():
+            for chunk_size in [1, 3, 1024]:
+                with self.subTest(name, chunk_size=chunk_size):
+                    c = list(file_utils.iter_json_array(get_file(data), chunk_size))
+                    self.assertEqual(c, expected)
+
+        error_cases = {
+            "edge_case_not_array": '{"a": 1}',
+            "edge_case_missing_separator": '["a" "b"]',
+            "edge_case_not_closed": '["a", "b"',
+            "edge_case_trailing_content": '["a"] garbage',
+            "edge_case_empty_array_trailing_content": "[] ]",
+        }
+
+        for name, data in error_cases.items():
+            with self.subTest(name):
+                with self.assertRaises(ValueError):
+                    list(file_utils.iter_json_array(get_file(data), 2))
+
     def test_random_filename(self):
         c = file_utils.random_filename("./")
         self.assertIsInstance(c, str)
@@ -111,3 +220,56 @@ class UtilsTestCase(TestCase):
     def test_random_string(self):
         c = string_utils.random_string(10)
         self.assertIsInstance(c, str)
+
+    def test_normalize_url(self):
+        cases = {
+            "normal_case": ("https://example.com/page", "https://example.com/page"),
+            "normal_case_case_insensitive_host": (
+                "HTTPS://Example.COM/Page",
+                "https://example.com/Page",
+            ),
+            "edge_case_default_port_and_fragment": (
+                "https://example.com:443/page?q=1#top",
+                "https://example.com/page?q=1",
+            ),
+            "edge_case_custom_port": (
+                "http://example.com:8000",
+                "http://example.com:8000/",
+            ),
+            "edge_case_fragment_route": (
+                "https://app.com#/inbox",
+                "https://app.com/#/inbox",
+            ),
+            "edge_case_fragment_hashbang": (
+                "https://app.com/#!/settings",
+                "https://app.com/#!/settings",
+            ),
+        }
+
+        for name, (url, expected) in cases.items():
+            with self.subTest(name):
+                self.assertEqual(url_utils.normalize_url(url), expected)
+
+    def test_url_key(self):
+        key = url_utils.url_key("https://example.com/#top")
+
+        self.assertEqual(len(key), 32)
+        self.assertEqual(key, url_utils.url_key("HTTPS://EXAMPLE.com"))
+        self.assertNotEqual(key, url_utils.url_key("https://example.com/other"))
+
+        # hash routed pages are distinct bookmarks
+        self.assertNotEqual(
+            url_utils.url_key("https://app.com/#/inbox"),
+            url_utils.url_key("https://app.com/#/settings"),
+        )
+
+    def test_url_domain(self):
+        cases = {
+            "normal_case": ("https://docs.python.org/3/", "docs.python.org"),
+            "edge_case_www": ("https://www.python.org/", "python.org"),
+            "edge_case_mobile_facebook": ("https://m.facebook.com/", "facebook.com"),
+        }
+
+        for name, (url, expected) in cases.items():
+            with self.subTest(name):
+                self.assertEqual(url_utils.url_domain(url), expected)
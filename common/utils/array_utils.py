@@ -1,4 +1,5 @@
-from typing import Generator
+from itertools import islice
+from typing import Generator, Iterable
 
 
 def window_list(data: list, size: int) -> Generator[list, None, None]:
@@ -13,6 +14,16 @@ def window_list(data: list, size: int) -> Generator[list, None, None]:
         yield data[i : i + size]
 
 
+def window_iter(data: Iterable, size: int) -> Generator[list, None, None]:
+    """Like `window_list` but consume any iterable lazily (generators, files)"""
+    if size <= 0:
+        raise ZeroDivisionError
+
+    iterator = iter(data)
+    while window := list(islice(iterator, size)):
+        yield window
+
+
 def unique_dicts_in_list(data: list[dict], key) -> list[dict]:
     unique_dicts = {d[key]: d for d in data if key in d}
     return list(unique_dicts.values())
@@ -0,0 +1,64 @@
+import hashlib
+
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler,
+    TemporaryFileUploadHandler,
+)
+
+
+class HashingUploadHandlerMixin:
+    """Hash the uploaded file and keep its first bytes while it is streamed,
+    so the file is not read again to get its hash or to sniff its type
+    ```
+    uploaded_file.file_hash  # sha256 hex digest
+    uploaded_file.head  # first `HEAD_SIZE` bytes
+    ```
+    """
+
+    HEAD_SIZE = 4096
+
+    def new_file(self, *args, **kwargs):
+        # set first as the memory handler raises `StopFutureHandlers`
+        self.hasher = hashlib.sha256()
+        self.head = b""
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        data = super().receive_data_chunk(raw_data, start)
+
+        # `None` means this handler consumed the chunk (stored it)
+        if data is None:
+            self.hasher.update(raw_data)
+            if len(self.head) < self.HEAD_SIZE:
+                self.head += raw_data[: self.HEAD_SIZE - len(self.head)]
+
+        return data
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+
+        if file is not None:
+            file.file_hash = self.hasher.hexdigest()
+            file.head = self.head
+
+        return file
+
+
+class HashingMemoryFileUploadHandler(
+    HashingUploadHandlerMixin, MemoryFileUploadHandler
+):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(
+    HashingUploadHandlerMixin, TemporaryFileUploadHandler
+):
+    pass
+
+
+def hashing_upload_handlers(request) -> list:
+    """Same as django default `FILE_UPLOAD_HANDLERS` but hashing"""
+    return [
+        HashingMemoryFileUploadHandler(request),
+        HashingTemporaryFileUploadHandler(request),
+    ]
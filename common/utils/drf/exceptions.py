@@ -1,10 +1,17 @@
 from django.db.models.deletion import ProtectedError
 from django.db.utils import IntegrityError
 from rest_framework import status
+from rest_framework.exceptions import APIException
 from rest_framework.response import Response
 from rest_framework.views import exception_handler
 
 
+class RequestTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "Request body is too large."
+    default_code = "request_too_large"
+
+
 def custom_exception_handler(exc, context):
     if isinstance(exc, ProtectedError):
         # error_message = str(exc)
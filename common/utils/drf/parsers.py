@@ -0,0 +1,28 @@
+from rest_framework.parsers import BaseParser
+
+from common.utils.drf.exceptions import RequestTooLarge
+
+
+class BinaryParser(BaseParser):
+    """Raw request body as bytes, for endpoints receiving file chunks,
+    bodies bigger than `max_size` are rejected without being read"""
+
+    media_type = "application/octet-stream"
+    max_size = None
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:  # empty body
+            return b""
+        if self.max_size is None:
+            return stream.read()
+
+        request = (parser_context or {}).get("request")
+        content_length = request.META.get("CONTENT_LENGTH") if request else None
+        if content_length and int(content_length) > self.max_size:
+            raise RequestTooLarge()
+
+        # the stream is not limited when the length is not sent (chunked)
+        data = stream.read(self.max_size + 1)
+        if len(data) > self.max_size:
+            raise RequestTooLarge()
+        return data
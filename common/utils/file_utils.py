@@ -1,17 +1,159 @@
+import codecs
+import gzip
 import hashlib
+import json
 import os
+import re
 import secrets
+import zlib
+from typing import Any, Generator
 
+from django.core.files import File
 from django.db import models
 
+try:
+    import zstandard
+except ImportError:  # zstd uploads are rejected without it
+    zstandard = None
+
+# magic bytes at the start of a compressed file
+COMPRESSIONS = {
+    "gzip": b"\x1f\x8b",
+    "zstd": b"\x28\xb5\x2f\xfd",
+}
+COMPRESSED_EXTENSIONS = {".gz": "gzip", ".zst": "zstd"}
+DECOMPRESSION_ERRORS = (OSError, EOFError, zlib.error) + (
+    (zstandard.ZstdError,) if zstandard else ()
+)
+
+
+def upload_attr(file, name: str):
+    """Attribute set by the hashing upload handlers on the uploaded file,
+    `file` could be the uploaded file or a `FieldFile` wrapping it"""
+    value = getattr(file, name, None)
+    if value is None:
+        value = getattr(getattr(file, "file", None), name, None)
+    return value
+
 
 def hash_file(file_field: models.FileField) -> str:
+    # already hashed by the upload handler while streaming
+    if file_hash := upload_attr(file_field, "file_hash"):
+        return file_hash
+
     hasher = hashlib.sha256()
     for chunk in iter(lambda: file_field.read(4096), b""):
         hasher.update(chunk)
     return hasher.hexdigest()
 
 
+def file_compression(file) -> str | None:
+    """Detect the compression of a file from its magic bytes"""
+    head = upload_attr(file, "head")
+    if head is None:
+        file.seek(0)
+        head = file.read(4)
+        file.seek(0)
+
+    for compression, magic in COMPRESSIONS.items():
+        if head.startswith(magic):
+            return compression
+
+    return None
+
+
+def strip_compression_extension(name: str) -> str:
+    root, ext = os.path.splitext(name)
+    if ext.lower() not in COMPRESSED_EXTENSIONS:
+        return name
+    # storages add a random suffix before the last extension on name clash
+    # `file.json.gz` -> `file.json_Ab12Cd3.gz`
+    return re.sub(r"_[a-zA-Z0-9]{7}$", "", root)
+
+
+class DecompressedSizeError(ValueError):
+    pass
+
+
+class DecompressedFile:
+    """Read only file-like object that decompresses the wrapped file on the fly
+    so the uncompressed content is never written to disk or fully loaded
+    ```
+    file = DecompressedFile(uploaded_file, "gzip", max_size=20 * 1024 * 1024)
+    file.read(64 * 1024)
+    ```
+    raise `DecompressedSizeError` when decompressed bytes exceed `max_size`
+    """
+
+    def __init__(self, file, compression: str, max_size: int = None):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression is not supported")
+
+        self.fileobj = file
+        self.compression = compression
+        self.max_size = max_size
+
+        self._stream = None
+        self._position = 0
+
+    def _open(self):
+        self.fileobj.seek(0)
+        if self.compression == "gzip":
+            return gzip.GzipFile(fileobj=self.fileobj, mode="rb")
+
+        decompressor = zstandard.ZstdDecompressor()
+        return decompressor.stream_reader(
+            self.fileobj, read_across_frames=True, closefd=False
+        )
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        # only rewinding is needed, it restarts the decompression
+        if offset != 0 or whence != os.SEEK_SET:
+            raise OSError("DecompressedFile can only seek to the start")
+
+        if self._stream is not None:
+            self._stream.close()
+        self._stream = None
+        self._position = 0
+        return 0
+
+    def tell(self) -> int:
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        if self._stream is None:
+            self._stream = self._open()
+
+        if size is None or size < 0:
+            return b"".join(iter(lambda: self.read(64 * 1024), b""))
+
+        try:
+            data = self._stream.read(size)
+        except DECOMPRESSION_ERRORS as e:
+            raise ValueError(f"Corrupted {self.compression} file") from e
+
+        self._position += len(data)
+        if self.max_size is not None and self._position > self.max_size:
+            raise DecompressedSizeError(
+                f"Decompressed file exceeds {self.max_size} bytes"
+            )
+
+        return data
+
+    def close(self):
+        self.seek(0)
+
+
+class MovableFile(File):
+    """File already on local disk, storages move it into place on save
+    instead of copying its content (same as `TemporaryUploadedFile`)"""
+
+    def temporary_file_path(self) -> str:
+        return self.file.name
+
+
 def random_filename(path, ext="html"):
     def generate():
         new_name = f"{secrets.token_hex(12)}.{ext}"
@@ -22,3 +164,76 @@ def random_filename(path, ext="html"):
         file_path = generate()
 
     return file_path
+
+
+def iter_json_array(file, chunk_size: int = 64 * 1024) -> Generator[Any, None, None]:
+    """Yield items of a top level json array one by one without loading
+    the whole file, raise `ValueError` on malformed content"""
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf8")()
+
+    buffer, pos, eof = "", 0, False
+
+    def read_more() -> bool:
+        nonlocal buffer, pos, eof
+        if eof:
+            return False
+
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + text_decoder.decode(chunk, final=eof)
+        pos = 0
+        return True
+
+    def next_char() -> str:
+        # skip whitespaces and return the next meaningful char (or "" on eof)
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not read_more():
+                return ""
+
+    def check_end():
+        # nothing but whitespaces after the closing bracket
+        nonlocal pos
+        pos += 1
+        if next_char() != "":
+            raise ValueError("Unexpected content after the json array")
+
+    if next_char() != "[":
+        raise ValueError("Json content is not an array")
+    pos += 1
+
+    if next_char() == "]":
+        check_end()
+        return
+
+    while True:
+        next_char()
+        # keep a lookahead so numbers like `1.5e10` aren't cut by chunk borders
+        while len(buffer) - pos < 64 and read_more():
+            pass
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+            # a number at the buffer end may continue in the next chunk
+            if end == len(buffer) and read_more():
+                continue
+        except json.JSONDecodeError as e:
+            if read_more():
+                continue
+            raise ValueError(f"Invalid json item at char {e.pos}") from e
+
+        pos = end
+        yield item
+
+        separator = next_char()
+        if separator == "]":
+            check_end()
+            return
+        if separator != ",":
+            raise ValueError("Invalid json array separator")
+        pos += 1
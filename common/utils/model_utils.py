@@ -1,5 +1,8 @@
+import io
+import json
 import threading
-from datetime import date
+from datetime import date, datetime
+from typing import Iterable
 
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
@@ -16,6 +19,7 @@ class FileSizeValidator:
 
     def __call__(self, value):
         max_size = self.size_MB * 1024 * 1024  # 5MB
+        # compressed content is limited while decompressed by the parser
         if value.size > max_size:
             raise ValidationError(_(f"File size should not exceed {self.size_MB}MB."))
 
@@ -26,25 +30,36 @@ def is_future_date_validator(value: date):
         raise ValidationError("date must be in the future.")
 
 
-def clone(instance, **kwargs):
-    instance.pk = None
-    for field, value in kwargs.items():
-        setattr(instance, field, value)
-    instance.save()
-
-    return instance
-
-
-def bulk_clone(qs, changes: dict):
-    model = qs.model
-    instances = []
-    for instance in qs:
-        instance.pk = None
-        for field, value in changes.items():
-            setattr(instance, field, value)
-        instances.append(instance)
-
-    return model.objects.bulk_create(instances)
+def _copy_value(value) -> str:
+    # postgres COPY text format
+    if value is None:
+        return r"\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    elif isinstance(value, (date, datetime)):
+        value = value.isoformat()
+
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_to_table(cursor, table: str, columns: list[str], rows: Iterable) -> None:
+    """Load rows into table using postgres `COPY FROM STDIN` in one round trip"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(map(_copy_value, row)))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    columns = ", ".join(f'"{column}"' for column in columns)
+    cursor.copy_expert(f'COPY "{table}" ({columns}) FROM STDIN', buffer)
 
 
 class CentralizedBulkCreator:
@@ -1,4 +1,10 @@
+import hashlib
 import re
+from urllib.parse import urlsplit, urlunsplit
+
+import urllib3
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
 
 
 def url_builder(url, domain):
@@ -17,3 +23,42 @@ def url_builder(url, domain):
 def is_valid_domain(domain):
     pattern = r"^(?!-)([A-Za-z0-9-]{1,63}(?<!-)\.)+[A-Za-z]{2,6}$"
     return re.match(pattern, domain) is not None
+
+
+def url_domain(url: str) -> str:
+    # domain with subdomains
+    host = urllib3.util.parse_url(url).host or ""
+    if host.startswith("www."):
+        host = host[4:]
+    elif host.startswith("m.facebook"):
+        host = host[2:]
+
+    return host
+
+
+def normalize_url(url: str) -> str:
+    """Lowercase scheme and host, drop default port and the fragment unless
+    it is a route of a single page app (`#/inbox`, `#!/inbox`)"""
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url.strip()
+
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or "").lower()
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+    if parts.username or parts.password:
+        netloc = f"{parts.username or ''}:{parts.password or ''}@{netloc}"
+
+    fragment = parts.fragment if parts.fragment.startswith(("/", "!")) else ""
+
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, fragment))
+
+
+def url_key(url: str) -> str:
+    """Fixed width (32 chars) key of the normalized url to index on"""
+    return hashlib.blake2b(
+        normalize_url(url).encode("utf8"), digest_size=16
+    ).hexdigest()
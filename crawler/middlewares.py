@@ -1,3 +1,4 @@
+import hashlib
 from urllib.parse import urlencode
 
 from App import models, tasks
@@ -10,14 +11,22 @@ class LogResponseMiddleware:
         # body in a file, and store the file path in the database
         bookmark = request.meta.get("bookmark")
 
+        # same page as the stored webpage, nothing to extract or store
+        content_hash = hashlib.sha256(response.body).hexdigest()
+        request.meta["content_hash"] = content_hash
+        request.meta["unchanged"] = response.status == 304 or (
+            content_hash == getattr(bookmark, "webpage_content_hash", None)
+        )
+
         log = await models.ScrapyResponseLog.objects.acreate(
             bookmark=bookmark,
             status_code=response.status,
             error=None
-            if response.status == 200
+            if response.status in (200, 304)
             else f"HTTP status code {response.status}",
         )
-        await django_wrapper(log.store_file, response.body)
+        if not request.meta["unchanged"]:
+            await django_wrapper(log.store_file, response.body)
         return response
 
     async def process_exception(self, request, exception, spider):
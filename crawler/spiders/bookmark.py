@@ -2,7 +2,11 @@ import scrapy
 
 
 class BookmarkSpider(scrapy.Spider):
+    """Crawl bookmarks annotated with `with_validators()`, bookmarks having a
+    webpage are requested conditionally and unchanged pages are skipped"""
+
     name = "bookmark"
+    handle_httpstatus_list = [304]
 
     def __init__(self, bookmarks: list):
         self.bookmarks = bookmarks
@@ -10,18 +14,51 @@ class BookmarkSpider(scrapy.Spider):
     def start_requests(self):
         # for url in self.urls:
         for bookmark in self.bookmarks:
-            kwargs = {
-                "callback": self.parse,
-                "cb_kwargs": {"bookmark": bookmark},
-                "meta": {"bookmark": bookmark},
-            }
-            if cookies := bookmark.hooks.crawler_cookies():
-                kwargs["cookies"] = cookies
+            yield self.bookmark_request(bookmark)
+
+    def bookmark_request(self, bookmark, meta=None, **kwargs) -> scrapy.Request:
+        kwargs = {
+            "callback": self.parse,
+            "cb_kwargs": {"bookmark": bookmark},
+            "meta": {"bookmark": bookmark, **(meta or {})},
+            **kwargs,
+        }
+        if cookies := bookmark.hooks.crawler_cookies():
+            kwargs["cookies"] = cookies
+        if headers := self.conditional_headers(bookmark):
+            kwargs["headers"] = headers
+
+        return scrapy.Request(bookmark.url, **kwargs)
 
-            yield scrapy.Request(bookmark.url, **kwargs)
+    @staticmethod
+    def conditional_headers(bookmark) -> dict:
+        headers = {}
+        if etag := getattr(bookmark, "webpage_etag", None):
+            headers["If-None-Match"] = etag
+        if last_modified := getattr(bookmark, "webpage_last_modified", None):
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    @staticmethod
+    def response_validators(response) -> dict:
+        def header(name):
+            value = response.headers.get(name)
+            return value.decode("latin-1") if value else None
+
+        last_modified = header("Last-Modified")
+        return {
+            "etag": header("ETag"),
+            "last_modified": last_modified and last_modified[:64],
+            "content_hash": response.meta.get("content_hash"),
+        }
 
     def parse(self, response, bookmark):
+        if response.meta.get("unchanged"):
+            return
+
         ItemLoader = bookmark.hooks.crawler_item_loader()
         item_loader = ItemLoader(response=response, bookmark=bookmark)
 
-        yield item_loader.load_item()
+        item = item_loader.load_item()
+        item["validators"] = self.response_validators(response)
+        yield item
@@ -0,0 +1,165 @@
+import time
+
+from django.db import close_old_connections
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+from scrapy.spidermiddlewares.httperror import HttpError
+from twisted.internet import task, threads
+
+from App import controllers, models
+from crawler.pipelines import SQLitePipeline
+from crawler.spiders.bookmark import BookmarkSpider
+
+
+class BookmarksFrontierSpider(BookmarkSpider):
+    """Never ending spider of the crawler service, it pulls single bookmarks
+    from the shared `CrawlFrontier` whenever it has room, so many services
+    balance the work between them, each finished request releases its url
+    and the bookmarks that followed it get the same page.
+    The frontier decides which domains may be requested (politeness), the
+    response status of every request is reported back to it"""
+
+    name = "bookmarks_frontier"
+    custom_settings = {"LOGSTATS_INTERVAL": 10.0}  # pages/min in the logs
+
+    POLL_INTERVAL = 0.5  # seconds
+    # bookmarks, the others wait in the frontier, leased ones of a crashed
+    # service are requeued by the frontier once their lease expires
+    MAX_IN_FLIGHT = 64
+
+    def __init__(self):
+        super().__init__(bookmarks=[])
+        self.frontier = controllers.CrawlFrontier()
+        self.in_flight = {}  # {bookmark_id: frontier entry}
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+
+        crawler.signals.connect(spider.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        for signal in [
+            signals.item_scraped,
+            signals.item_dropped,
+            signals.item_error,
+            signals.spider_error,
+        ]:
+            crawler.signals.connect(spider.response_done, signal=signal)
+
+        return spider
+
+    def spider_opened(self, spider):
+        self.poller = task.LoopingCall(self.poll)
+        self.poller.start(self.POLL_INTERVAL)
+
+    def spider_idle(self, spider):
+        raise DontCloseSpider
+
+    def poll(self):
+        try:
+            self.frontier.heartbeat()
+
+            room = self.MAX_IN_FLIGHT - len(self.in_flight)
+            entries = self.frontier.pop(room) if room > 0 else []
+        except Exception as e:  # redis down, keep polling
+            self.logger.error(f"Polling crawl frontier failed: {e}")
+            return
+
+        if entries:
+            self.in_flight.update({e["id"]: e for e in entries})
+
+            # the orm can't run in the reactor (asyncio) thread
+            deferred = threads.deferToThread(self.load_bookmarks, entries)
+            deferred.addCallback(self.schedule_bookmarks, entries)
+            deferred.addErrback(self.load_failed, entries)
+
+    @staticmethod
+    def load_bookmarks(entries: list[dict]) -> list:
+        close_old_connections()  # threads outlive the db connections
+        ids = [e["id"] for e in entries]
+        return list(models.Bookmark.objects.filter(pk__in=ids).with_validators())
+
+    def schedule_bookmarks(self, bookmarks: list, entries: list[dict]):
+        for bookmark in bookmarks:
+            request = self.bookmark_request(
+                bookmark,
+                meta={"frontier_entry": self.in_flight[bookmark.id]},
+                errback=self.request_failed,
+                dont_filter=True,  # deduplicated by the frontier
+            )
+            self.crawler.engine.crawl(request)
+
+        # deleted in between
+        found_ids = {b.id for b in bookmarks}
+        for entry in entries:
+            if entry["id"] not in found_ids:
+                self.entry_done(entry)
+
+    def load_failed(self, failure, entries: list[dict]):
+        self.logger.error(f"Loading bookmarks failed: {failure.getErrorMessage()}")
+        for entry in entries:
+            self.entry_done(entry)
+
+    def parse(self, response, bookmark):
+        if response.meta.get("unchanged"):
+            # no item comes out to signal the end of the request
+            self.request_done(response.request, response=response)
+
+        yield from super().parse(response, bookmark)
+
+    def response_done(self, item=None, response=None, **kwargs):
+        if response is not None:
+            self.request_done(response.request, item, response)
+
+    def request_failed(self, failure):
+        # non 2xx responses (429, 503) come as HttpError
+        response = failure.value.response if failure.check(HttpError) else None
+        self.request_done(failure.request, response=response)
+
+    def request_done(self, request, item=None, response=None):
+        entry = request.meta.get("frontier_entry")
+        if entry is not None:
+            self.entry_done(entry, item, response)
+
+    @staticmethod
+    def retry_after(response) -> int | None:
+        # the http date form is ignored, the backoff still applies
+        value = response.headers.get("Retry-After", b"").decode().strip()
+        return int(value) if value.isdigit() else None
+
+    def entry_done(self, entry: dict, item=None, response=None):
+        if self.in_flight.pop(entry["id"], None) is None:
+            return
+
+        status = retry_after = None
+        unchanged = False
+        if response is not None:
+            status, retry_after = response.status, self.retry_after(response)
+            unchanged = bool(response.meta.get("unchanged")) and item is None
+            self.crawler.stats.inc_value(f"bookmarks_frontier/status/{status}")
+
+        # from the push to the result, the wait in the frontier included
+        latency = time.time() - entry["sent_at"]
+        self.crawler.stats.inc_value("bookmarks_frontier/latency_total", latency)
+        self.crawler.stats.max_value("bookmarks_frontier/latency_max", latency)
+        self.logger.debug(f"Bookmark<{entry['id']}> done {latency:.2f}s after sent")
+
+        self.crawler.stats.inc_value("bookmarks_frontier/bookmarks")
+        deferred = threads.deferToThread(
+            self.complete_entry, entry, item, status, retry_after, unchanged
+        )
+        deferred.addErrback(
+            lambda f: self.logger.error(f"Completing failed: {f.getErrorMessage()}")
+        )
+
+    def complete_entry(
+        self, entry: dict, item=None, status=None, retry_after=None, unchanged=False
+    ):
+        # an unchanged page has nothing to give to the followers
+        followers = self.frontier.complete(entry, status, retry_after, unchanged)
+        self.crawler.stats.inc_value("bookmarks_frontier/followers", len(followers))
+
+        # same url of other bookmarks crawled once
+        if item is not None and item.get("bookmark"):
+            for follower in followers:
+                SQLitePipeline.store_webpage(item, follower["id"])
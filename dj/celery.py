@@ -31,5 +31,10 @@ app.conf.beat_schedule = {
         "task": "App.tasks.delete_bookmarks_beat_task",
         "schedule": timedelta(days=1),
         "args": (),
-    }
+    },
+    "delete_expired_uploads": {
+        "task": "App.tasks.delete_expired_uploads_beat_task",
+        "schedule": timedelta(hours=1),
+        "args": (),
+    },
 }
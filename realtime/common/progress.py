@@ -4,9 +4,9 @@ import uuid
 from datetime import datetime, timedelta
 
 from fastapi import Request
-from sse_starlette.sse import EventSourceResponse
+from sse_starlette.sse import EventSourceResponse, ServerSentEvent
 
-from .redis_utils import RedisPubSub
+from .redis_utils import ProgressState, RedisPubSub
 
 
 class UserProgressSingleton:
@@ -20,50 +20,47 @@ class UserProgressSingleton:
         self.user_id = user_id
 
         self.created = datetime.now()
-        self._total = 0
-        self.individual_progress = {}
-        self.individual_limit = 80
-        self.message = ""
-        self.DONE = False
+        # last snapshot of the redis state, shared by the user streams
+        self.state = ProgressState.parse([None] * 5)
+        self.streams = 0  # connected clients of the user in this process
+        self.changed = asyncio.Condition()  # streams sleep on it until a change
 
     @property
-    def total(self):
-        return self._total
-
-    @total.setter
-    def total(self, value):
-        self._total += value
+    def total(self) -> int:
+        return self.state["total"]
 
     @property
     def progress(self) -> float:
-        total_progress = sum(self.individual_progress.values()) / self.individual_limit
-        return total_progress / (self.total or 1) * 100
-
-    def change(self, data):
-        if data["type"] == RedisPubSub.MessageTypes.INIT_UPLOAD:
-            self.message = "Start Uploading"
-        elif data["type"] == RedisPubSub.MessageTypes.FILE_UPLOAD:
-            total = data["total_bookmarks"]
-            self.total = total
-            self.message = f"new uploaded bookmarks: {total}"
-        elif data["type"] == RedisPubSub.MessageTypes.BOOKMARK_CHANGE:
-            bookmark_id = data["bookmark_id"]
-            status = data["status"]
-            self.individual_progress[bookmark_id] = status
-            self.message = f"bookmark {bookmark_id} status: {status / 80 * 100}%"
-        elif data["type"] == RedisPubSub.MessageTypes.FINISH:
-            self.DONE = True
-        else:
-            self.DONE = self.progress >= 100
-
-        if self.DONE:
-            self.message = "All bookmarks are uploaded"
+        return self.state["progress"]
+
+    @property
+    def DONE(self) -> bool:
+        return self.state["done"]
+
+    async def refresh(self) -> None:
+        # messages only notify, the state is aggregated by their publishers
+        state = await ProgressState.snapshot(self.user_id)
+
+        async with self.changed:
+            self.state = state
+            self.changed.notify_all()
+
+    async def wait_change(self, state: dict, timeout: float) -> bool:
+        """Sleep until the state differs from `state`, False on timeout"""
+        async with self.changed:
+            try:
+                await asyncio.wait_for(
+                    self.changed.wait_for(lambda: self.state != state), timeout
+                )
+            except asyncio.TimeoutError:
+                return False
+        return True
 
     def __str__(self):
         data = {
             "total": self.total,
             "progress": self.progress,
-            "message": self.message,
+            "message": self.state["message"],
         }
         return json.dumps(data)
 
@@ -81,13 +78,48 @@ class UserProgressSingleton:
                 cls._instances[user_id] = _instance
             return _instance
 
+    @classmethod
+    async def connect(cls, user_id) -> "UserProgressSingleton":
+        """Read the user stream from his first connection, so only users
+        connected to this process are listened to and kept in memory"""
+        async with cls._lock:
+            _instance = cls._instances.get(user_id)
+            if _instance is None:
+                _instance = cls(user_id)
+                cls._instances[user_id] = _instance
+
+            _instance.streams += 1
+            if _instance.streams == 1:
+                await _instance.refresh()
+                RedisPubSub.subscribe_user(user_id, _instance.state["event_id"])
+
+            return _instance
+
+    @classmethod
+    async def disconnect(cls, user_id) -> None:
+        async with cls._lock:
+            _instance = cls._instances.get(user_id)
+            if _instance is None:
+                return
+
+            _instance.streams -= 1
+            if _instance.streams <= 0:
+                RedisPubSub.unsubscribe_user(user_id)
+                del cls._instances[user_id]
+
 
 class ProgressSSE:
-    MESSAGE_STREAM_DELAY = 0.4  # second
+    MAX_MESSAGES_PER_SECOND = 4  # changes in between are coalesced
+    HEARTBEAT_INTERVAL = 15  # seconds, keeps proxies from closing idle streams
+    MAX_STREAM_TIME = timedelta(hours=1)
 
-    def __init__(self, user_progress: UserProgressSingleton):
+    def __init__(self, user_progress: UserProgressSingleton, last_event_id=None):
         self.user_progress = user_progress
-        self.progress = 0
+        self.state = None  # last sent state
+
+        # reconnected client already has this state, nothing is replayed
+        if last_event_id == user_progress.state["event_id"]:
+            self.state = user_progress.state
 
     def wrap_message(self, data):
         return json.dumps(
@@ -98,22 +130,36 @@ class ProgressSSE:
             }
         )
 
-    async def event_loop(self, request: Request):
-        force_break_time = datetime.now() + timedelta(hours=1)
+    async def event_loop(self):
+        force_break_time = datetime.now() + self.MAX_STREAM_TIME
+
+        try:
+            while datetime.now() < force_break_time:
+                # state changed
+                if self.state != self.user_progress.state:
+                    self.state = self.user_progress.state
 
-        while datetime.now() < force_break_time and not await request.is_disconnected():
-            progress = self.user_progress.progress
-            # progress changed
-            if self.progress != progress:
-                self.progress = progress
+                    # missed events are collapsed in the state, the client
+                    # resumes from its id (sent back as `Last-Event-ID`)
+                    message = str(self.user_progress)
+                    yield ServerSentEvent(
+                        data=self.wrap_message(message), id=self.state["event_id"]
+                    )
 
-                message = str(self.user_progress)
-                yield self.wrap_message(message)
+                    if self.user_progress.DONE:
+                        break
 
-            if self.user_progress.DONE:
-                break
+                    await asyncio.sleep(1 / self.MAX_MESSAGES_PER_SECOND)
+                elif self.user_progress.DONE:
+                    break  # resumed after the end
 
-            await asyncio.sleep(self.MESSAGE_STREAM_DELAY)
+                # no wakeups while nothing changes
+                timeout = (force_break_time - datetime.now()).total_seconds()
+                await self.user_progress.wait_change(self.state, max(timeout, 0))
+        finally:
+            # also runs when the client goes away and the stream is cancelled
+            await UserProgressSingleton.disconnect(self.user_progress.user_id)
 
     async def stream(self, request: Request) -> EventSourceResponse:
-        return EventSourceResponse(self.event_loop(request))
+        # disconnects are detected by the response, heartbeats sent as pings
+        return EventSourceResponse(self.event_loop(), ping=self.HEARTBEAT_INTERVAL)
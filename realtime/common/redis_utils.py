@@ -1,5 +1,7 @@
+import asyncio
 import json
 import os
+import typing
 
 import redis
 from pydantic import BaseModel, Field
@@ -9,17 +11,22 @@ from redis import asyncio as aioredis
 class RedisPubSub:
     CHANNEL_NAME = os.getenv("PUB_SUB_CHANNEL_NAME")
     REDIS_URL = os.getenv("REDIS_URL")
+    BOOKMARKS_PER_MESSAGE = 1000
+    READ_COUNT = 500
+    READ_BLOCK_MS = 1000
 
     clients = {
         "sync": redis.from_url(REDIS_URL),
         "async": aioredis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True),
     }
+    _cursors = {}  # {user stream: last read event id}
 
     class MessageTypes:
         INIT_UPLOAD = 0
         FILE_UPLOAD = 1
         BOOKMARK_CHANGE = 2
         FINISH = 3
+        BOOKMARKS_CHANGE = 4
 
     class InitUploadData(BaseModel, extra="allow"):
         user_id: int
@@ -34,10 +41,20 @@ class RedisPubSub:
         user_id: int
         bookmark_id: int
         status: int
+        previous_status: int = 0
         type: int = Field(
             default_factory=lambda: RedisPubSub.MessageTypes.BOOKMARK_CHANGE
         )
 
+    class BookmarksChangeData(BaseModel, extra="allow"):
+        user_id: int
+        bookmark_ids: list[int]
+        status: int
+        previous_status: int = 0  # same for all the ids
+        type: int = Field(
+            default_factory=lambda: RedisPubSub.MessageTypes.BOOKMARKS_CHANGE
+        )
+
     class FinishData(BaseModel, extra="allow"):
         user_id: int
         type: int = Field(default_factory=lambda: RedisPubSub.MessageTypes.FINISH)
@@ -53,6 +70,8 @@ class RedisPubSub:
             data = cls.FileUploadData(**data)
         elif _type == cls.MessageTypes.BOOKMARK_CHANGE:
             data = cls.BookmarkChangeData(**data)
+        elif _type == cls.MessageTypes.BOOKMARKS_CHANGE:
+            data = cls.BookmarksChangeData(**data)
         elif _type == cls.MessageTypes.FINISH:
             data = cls.FinishData(**data)
         else:
@@ -60,20 +79,189 @@ class RedisPubSub:
 
         return data.dict()
 
+    @classmethod
+    def user_stream(cls, user_id: int) -> str:
+        return f"{cls.CHANNEL_NAME}:{user_id}:events"
+
     @classmethod
     def pub(cls, data: dict) -> None:
-        data = cls.__validate_data(data)
+        cls.pub_many([data])
+
+    @classmethod
+    def pub_many(cls, messages: typing.Iterable[dict]) -> None:
+        """Apply the messages to the users progress state and append them to
+        the users streams (change notifications) in one round trip"""
         client = cls.clients["sync"]
-        client.publish(cls.CHANNEL_NAME, json.dumps(data))
+        pipe = client.pipeline(transaction=False)
+        for data in messages:
+            data = cls.__validate_data(data)
+            ProgressState.update(data, pipe)
+        pipe.execute()
+
+    @classmethod
+    def pub_bookmarks_change(
+        cls, user_id: int, bookmark_ids: list[int], status: int, previous_status=0
+    ) -> None:
+        """Status change of many bookmarks as one message per
+        `BOOKMARKS_PER_MESSAGE` ids instead of one message per bookmark"""
+        size = cls.BOOKMARKS_PER_MESSAGE
+        cls.pub_many(
+            {
+                "type": cls.MessageTypes.BOOKMARKS_CHANGE,
+                "user_id": user_id,
+                "bookmark_ids": bookmark_ids[i : i + size],
+                "status": status,
+                "previous_status": previous_status,
+            }
+            for i in range(0, len(bookmark_ids), size)
+        )
+
+    @classmethod
+    def subscribe_user(cls, user_id: int, last_id: str) -> None:
+        """Read the user stream from `last_id` (the snapshot the streams start
+        with) so no event between the snapshot and the first read is lost"""
+        cls._cursors[cls.user_stream(user_id)] = last_id
+
+    @classmethod
+    def unsubscribe_user(cls, user_id: int) -> None:
+        cls._cursors.pop(cls.user_stream(user_id), None)
 
     @classmethod
     async def sub(cls, callback):
+        """Read the streams of the users subscribed with `subscribe_user` only,
+        by one blocking XREAD for all of them"""
         client = cls.clients["async"]
-        pubsub = client.pubsub()
-        await pubsub.subscribe(cls.CHANNEL_NAME)
         while True:
-            message = await pubsub.get_message(
-                ignore_subscribe_messages=True, timeout=1.0
+            if not cls._cursors:
+                await asyncio.sleep(cls.READ_BLOCK_MS / 1000)
+                continue
+
+            # new subscriptions are read after at most one block
+            streams = await client.xread(
+                dict(cls._cursors), count=cls.READ_COUNT, block=cls.READ_BLOCK_MS
+            )
+            for stream, events in streams or []:
+                event_id, fields = events[-1]
+                if stream in cls._cursors:
+                    cls._cursors[stream] = event_id
+
+                # the state already has all of them, notify once per read
+                await callback(json.loads(fields["data"]))
+
+
+class ProgressState:
+    """User progress aggregates kept in redis so any realtime replica can
+    serve them, updated by the publishers with one atomic script per message
+    that also appends it to the user capped stream
+    ```
+    progress:<user_id>  {total, status_sum, message, done, event_id}
+    <PUB_SUB_CHANNEL_NAME>:<user_id>:events  last `STREAM_MAXLEN` events
+    ```
+    status changes carry the previous status, so the sum is moved by deltas
+    and no per bookmark state is stored, `event_id` is the last event applied
+    """
+
+    INDIVIDUAL_LIMIT = 80  # status of a fully processed bookmark
+    IDLE_TTL = 60 * 60  # seconds, state of an upload nothing happens to
+    DONE_TTL = 10 * 60
+    STREAM_MAXLEN = 1000  # approximate, trimmed by whole nodes
+
+    # ARGV: total delta, status sum delta, message, done, ttl, event
+    UPDATE_SCRIPT = """
+    local total_delta = tonumber(ARGV[1])
+    if total_delta ~= 0 then
+        redis.call("HINCRBY", KEYS[1], "total", total_delta)
+    end
+
+    local status_delta = tonumber(ARGV[2])
+    if status_delta ~= 0 then
+        redis.call("HINCRBY", KEYS[1], "status_sum", status_delta)
+    end
+
+    if ARGV[3] ~= "" then
+        redis.call("HSET", KEYS[1], "message", ARGV[3])
+    end
+    if ARGV[4] ~= "" then
+        redis.call("HSET", KEYS[1], "done", ARGV[4])
+    end
+
+    local event_id = redis.call(
+        "XADD", KEYS[2], "MAXLEN", "~", ARGV[7], "*", "data", ARGV[6]
+    )
+    redis.call("HSET", KEYS[1], "event_id", event_id)
+
+    redis.call("EXPIRE", KEYS[1], ARGV[5])
+    redis.call("EXPIRE", KEYS[2], ARGV[5])
+    return event_id
+    """
+    _update_script = None
+
+    @staticmethod
+    def key(user_id: int) -> str:
+        return f"progress:{user_id}"
+
+    @classmethod
+    def script_args(cls, data: dict) -> list:
+        types = RedisPubSub.MessageTypes
+        total_delta, status_delta, message, done = 0, 0, "", ""
+        ttl = cls.IDLE_TTL
+
+        if data["type"] == types.INIT_UPLOAD:
+            message, done = "Start Uploading", 0
+        elif data["type"] == types.FILE_UPLOAD:
+            # more bookmarks to process after a finish (e.g. next chunk)
+            total_delta, done = data["total_bookmarks"], 0
+            message = f"new uploaded bookmarks: {total_delta}"
+        elif data["type"] == types.BOOKMARK_CHANGE:
+            status = data["status"]
+            status_delta = status - data["previous_status"]
+            percent = status / cls.INDIVIDUAL_LIMIT * 100
+            message = f"bookmark {data['bookmark_id']} status: {percent}%"
+        elif data["type"] == types.BOOKMARKS_CHANGE:
+            status, count = data["status"], len(data["bookmark_ids"])
+            status_delta = (status - data["previous_status"]) * count
+            percent = status / cls.INDIVIDUAL_LIMIT * 100
+            message = f"{count} bookmarks status: {percent}%"
+        elif data["type"] == types.FINISH:
+            message, done = "All bookmarks are uploaded", 1
+            ttl = cls.DONE_TTL
+
+        event = json.dumps(data, separators=(",", ":"))
+        return [total_delta, status_delta, message, done, ttl, event]
+
+    @classmethod
+    def update(cls, data: dict, client) -> None:
+        """Queue the update on `client`, usually the pipeline publishing it"""
+        if cls._update_script is None:
+            cls._update_script = RedisPubSub.clients["sync"].register_script(
+                cls.UPDATE_SCRIPT
             )
-            if message and message["type"] == "message":
-                await callback(json.loads(message["data"]))
+
+        user_id = data["user_id"]
+        cls._update_script(
+            keys=[cls.key(user_id), RedisPubSub.user_stream(user_id)],
+            args=[*cls.script_args(data), cls.STREAM_MAXLEN],
+            client=client,
+        )
+
+    @classmethod
+    def parse(cls, values: list) -> dict:
+        total, status_sum, message, done, event_id = values
+        total, status_sum = int(total or 0), int(status_sum or 0)
+
+        progress = status_sum / cls.INDIVIDUAL_LIMIT / (total or 1) * 100
+        return {
+            "total": total,
+            "progress": progress,
+            "message": message or "",
+            "done": done == "1",
+            "event_id": event_id or "0-0",
+        }
+
+    @classmethod
+    async def snapshot(cls, user_id: int) -> dict:
+        client = RedisPubSub.clients["async"]
+        values = await client.hmget(
+            cls.key(user_id), "total", "status_sum", "message", "done", "event_id"
+        )
+        return cls.parse(values)
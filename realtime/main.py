@@ -1,12 +1,12 @@
 import asyncio
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
 from common.jwt_utils import JwtManager
 from common.progress import ProgressSSE, UserProgressSingleton
-from common.redis_utils import RedisPubSub
+from common.redis_utils import ProgressState, RedisPubSub
 
 load_dotenv()
 
@@ -30,18 +30,26 @@ app.add_middleware(
 @app.get("/progress")
 async def progress(request: Request):
     user_id = JwtManager.fastapi_auth(request).user_id
-    user_progress = await UserProgressSingleton.get_instance(user_id)
-    if user_progress is None:
-        raise HTTPException(status_code=404, detail="User progress not found")
+    # subscribed for the stream lifetime, unsubscribed when it ends
+    user_progress = await UserProgressSingleton.connect(user_id)
+    last_event_id = request.headers.get("last-event-id")
 
-    return await ProgressSSE(user_progress).stream(request)
+    return await ProgressSSE(user_progress, last_event_id).stream(request)
+
+
+@app.get("/progress/snapshot")
+async def progress_snapshot(request: Request):
+    # the state lives in redis so any replica answers without subscribing
+    user_id = JwtManager.fastapi_auth(request).user_id
+    return await ProgressState.snapshot(user_id)
 
 
 @app.on_event("startup")
 async def startup_event():
     async def callback(data: dict):
-        user_id = data["user_id"]
-        user_progress = await UserProgressSingleton.get_or_create_instance(user_id)
-        user_progress.change(data)
+        # messages are only received for users connected to this process
+        user_progress = await UserProgressSingleton.get_instance(data["user_id"])
+        if user_progress is not None:
+            await user_progress.refresh()
 
     asyncio.create_task(RedisPubSub.sub(callback))
@@ -0,0 +1 @@
+from .redis_utils_tests import *  # noqa
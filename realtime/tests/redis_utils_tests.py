@@ -0,0 +1,136 @@
+import asyncio
+from unittest import mock
+
+import fakeredis
+from django.test import SimpleTestCase
+
+from realtime.common.redis_utils import ProgressState, RedisPubSub
+
+Types = RedisPubSub.MessageTypes
+
+
+class StopReading(Exception):
+    pass
+
+
+class RedisPubSubTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.server = fakeredis.FakeServer()
+        self.client = fakeredis.FakeRedis(server=self.server, decode_responses=True)
+
+        clients = {"sync": fakeredis.FakeRedis(server=self.server)}
+        patches = [
+            mock.patch.dict(RedisPubSub.clients, clients),
+            mock.patch.object(RedisPubSub, "_cursors", {}),
+            mock.patch.object(RedisPubSub, "READ_BLOCK_MS", 10),
+            mock.patch.object(ProgressState, "_update_script", None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def snapshot(self, user_id: int) -> dict:
+        values = self.client.hmget(
+            ProgressState.key(user_id),
+            "total",
+            "status_sum",
+            "message",
+            "done",
+            "event_id",
+        )
+        return ProgressState.parse(values)
+
+    def read(self, max_reads: int = 1) -> list[dict]:
+        """Run `sub` until it notified `max_reads` times"""
+        received = []
+
+        async def callback(data):
+            received.append(data)
+            if len(received) >= max_reads:
+                raise StopReading()
+
+        async def run():
+            RedisPubSub.clients["async"] = fakeredis.FakeAsyncRedis(
+                server=self.server, decode_responses=True
+            )
+            with self.assertRaises(StopReading):
+                await asyncio.wait_for(RedisPubSub.sub(callback), timeout=5)
+
+        asyncio.run(run())
+        return received
+
+    def test_pub_many_progress_state(self):
+        RedisPubSub.pub_many(
+            [
+                {"type": Types.INIT_UPLOAD, "user_id": 1},
+                {"type": Types.FILE_UPLOAD, "user_id": 1, "total_bookmarks": 4},
+                {"type": Types.FILE_UPLOAD, "user_id": 2, "total_bookmarks": 1},
+            ]
+        )
+        RedisPubSub.pub_bookmarks_change(1, [1, 2], 40, previous_status=10)
+
+        state = self.snapshot(1)
+        self.assertEqual(state["total"], 4)
+        self.assertEqual(state["progress"], 30 * 2 / 80 / 4 * 100)
+        self.assertFalse(state["done"])
+
+        # every message is appended to the stream of its user
+        events = self.client.xrange(RedisPubSub.user_stream(1))
+        self.assertEqual(len(events), 3)
+        self.assertEqual(state["event_id"], events[-1][0])
+        self.assertEqual(self.snapshot(2)["total"], 1)
+
+        ttl = self.client.ttl(ProgressState.key(1))
+        self.assertTrue(ProgressState.DONE_TTL < ttl <= ProgressState.IDLE_TTL)
+
+    def test_pub_bookmarks_change_split(self):
+        bookmark_ids = list(range(RedisPubSub.BOOKMARKS_PER_MESSAGE + 1))
+        RedisPubSub.pub_bookmarks_change(1, bookmark_ids, 40, previous_status=10)
+
+        events = self.client.xrange(RedisPubSub.user_stream(1))
+        self.assertEqual(len(events), 2)
+        self.assertEqual(
+            self.snapshot(1)["progress"], 30 * len(bookmark_ids) / 80 * 100
+        )
+
+    def test_finish(self):
+        RedisPubSub.pub({"type": Types.FILE_UPLOAD, "user_id": 1, "total_bookmarks": 1})
+        RedisPubSub.pub({"type": Types.FINISH, "user_id": 1})
+
+        self.assertTrue(self.snapshot(1)["done"])
+        self.assertLessEqual(
+            self.client.ttl(ProgressState.key(1)), ProgressState.DONE_TTL
+        )
+
+        # more bookmarks stored after the finish
+        RedisPubSub.pub({"type": Types.FILE_UPLOAD, "user_id": 1, "total_bookmarks": 1})
+        self.assertFalse(self.snapshot(1)["done"])
+        self.assertEqual(self.snapshot(1)["total"], 2)
+
+    def test_sub_subscribed_users_only(self):
+        RedisPubSub.pub({"type": Types.INIT_UPLOAD, "user_id": 1})
+        last_id = self.snapshot(1)["event_id"]
+
+        RedisPubSub.subscribe_user(1, last_id)
+        for user_id in [1, 2]:
+            RedisPubSub.pub_many(
+                {"type": Types.FILE_UPLOAD, "user_id": user_id, "total_bookmarks": i}
+                for i in [1, 2]
+            )
+
+        # events after the subscription, notified once per read
+        received = self.read()
+        self.assertEqual(len(received), 1)
+        self.assertEqual(received[0]["user_id"], 1)
+        self.assertEqual(received[0]["total_bookmarks"], 2)
+
+        # the cursor moved to the last read event
+        stream = RedisPubSub.user_stream(1)
+        self.assertEqual(RedisPubSub._cursors[stream], self.snapshot(1)["event_id"])
+
+        RedisPubSub.pub({"type": Types.FINISH, "user_id": 1})
+        received = self.read()
+        self.assertEqual(received[0]["type"], Types.FINISH)
+
+        RedisPubSub.unsubscribe_user(1)
+        self.assertEqual(RedisPubSub._cursors, {})
@@ -0,0 +1,81 @@
+"""Compare rows/sec of `bulk_create` and `copy_create` bookmark insert paths
+
+Needs the django database, every run is rolled back
+Usage:
+    python manage.py shell -c \
+        "from resources.benchmarks import bookmark_insert_benchmark as b; b.main()"
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from App import models
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+def make_bookmarks(user, count: int) -> list:
+    bookmarks = []
+    for i in range(count):
+        bookmark = models.Bookmark(
+            user=user,
+            url=f"https://example{i % 97}.com/benchmark/page/{i}",
+            title=f"Page {i}",
+            more_data={"icon": "data:image/png;base64,AAAA"},
+        )
+        bookmark.set_url_fields()
+        bookmarks.append(bookmark)
+    return bookmarks
+
+
+def link_websites(user, bookmarks):
+    domains = {b.domain for b in bookmarks}
+    models.Website.objects.bulk_create(
+        [models.Website(user=user, domain=d) for d in domains], ignore_conflicts=True
+    )
+    return {w.domain: w for w in user.websites.filter(domain__in=domains)}
+
+
+def bulk_create_path(user, bookmarks):
+    # The old path, insert then a second pass to link websites
+    models.Bookmark.objects.bulk_create(bookmarks, batch_size=250)
+    websites = link_websites(user, bookmarks)
+    for b in bookmarks:
+        b.website = websites[b.domain]
+    models.Bookmark.objects.bulk_update(bookmarks, ["website"], batch_size=250)
+
+
+def copy_create_path(user, bookmarks):
+    link_websites(user, bookmarks)
+    models.Bookmark.objects.all().copy_create(bookmarks)
+
+
+def measure(method, count: int) -> float:
+    try:
+        with transaction.atomic():
+            user = User.objects.create(username="insert_benchmark")
+            bookmarks = make_bookmarks(user, count)
+
+            start = time.perf_counter()
+            method(user, bookmarks)
+            duration = time.perf_counter() - start
+            raise Rollback
+    except Rollback:
+        pass
+
+    return count / duration
+
+
+def main(sizes: list[int] = None):
+    print(f"{'rows':>8} | {'method':>12} | {'rows/sec':>10}")
+    for size in sizes or [1_000, 10_000, 100_000]:
+        for name, method in [
+            ("bulk_create", bulk_create_path),
+            ("copy_create", copy_create_path),
+        ]:
+            print(f"{size:>8} | {name:>12} | {measure(method, size):>10.0f}")
@@ -0,0 +1,128 @@
+"""Compare per batch latency and pages/sec of crawling bookmark batches with
+one `manage.py crawl_bookmarks` process per batch and with the long running
+crawler services sharing the crawl frontier
+
+Needs the django database, redis and a running `manage.py crawler_service`.
+By default pages are served locally, every loopback address (127.0.0.x) is
+one domain answering after `delay` seconds, the bookmarks of a benchmark
+user are deleted at the end. `local=False` crawls the last bookmarks of the
+database again (new webpages are stored)
+Usage:
+    python manage.py shell -c \
+        "from resources.benchmarks import crawler_benchmark as b; b.main()"
+"""
+import json
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.contrib.auth import get_user_model
+
+from App import controllers, models
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    delay = 0.2  # seconds, a slow website
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        body = f"<html><head><title>{self.path}</title></head></html>".encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def local_bookmarks(count: int, domains: int, delay: float):
+    PageHandler.delay = delay
+    server = ThreadingHTTPServer(("0.0.0.0", 0), PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    user, _ = get_user_model().objects.get_or_create(username="crawler_benchmark")
+    bookmarks = [
+        models.Bookmark(
+            user=user, url=f"http://127.0.0.{i % domains + 1}:{port}/page/{i}"
+        )
+        for i in range(count)
+    ]
+    bookmarks = models.Bookmark.objects.bulk_create(bookmarks)
+
+    try:
+        yield [b.id for b in bookmarks]
+    finally:
+        server.shutdown()
+        user.delete()
+
+
+def subprocess_batch(bookmark_ids: list[int]):
+    # The old path
+    command = ["python", "manage.py", "crawl_bookmarks", json.dumps(bookmark_ids)]
+    subprocess.run(command, capture_output=True, text=True, check=True)
+
+
+def service_batch(bookmark_ids: list[int]):
+    frontier = controllers.CrawlFrontier()
+    bookmarks = models.Bookmark.objects.filter(id__in=bookmark_ids)
+    batch_id = frontier.push(list(bookmarks.values_list("id", "url_key", "domain")))
+    frontier.wait(batch_id, timeout=10 * 60)
+
+
+def measure(method, batches: list[list[int]], workers: int) -> tuple[float, list]:
+    def timed(batch):
+        start = time.perf_counter()
+        method(batch)
+        return time.perf_counter() - start
+
+    # as many batches at once as scrapy celery worker concurrency
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as executor:
+        latencies = list(executor.map(timed, batches))
+    return time.perf_counter() - start, latencies
+
+
+def bookmarks_to_crawl(count: int, local: bool, domains: int, delay: float):
+    if local:
+        return local_bookmarks(count, domains, delay)
+
+    ids = models.Bookmark.objects.order_by("-id").values_list("id", flat=True)
+    return nullcontext(list(ids[:count]))
+
+
+def main(
+    count: int = 300,
+    batch_size: int = 30,
+    workers: int = 5,
+    local: bool = True,
+    domains: int = 20,
+    delay: float = 0.2,
+):
+    if not controllers.CrawlFrontier().is_alive():
+        print("Run `python manage.py crawler_service` first")
+        return
+
+    print(f"{'method':>12} | {'pages/sec':>9} | {'p50 batch':>9} | {'max batch':>9}")
+    for name, method in [("subprocess", subprocess_batch), ("service", service_batch)]:
+        # new local bookmarks per method, none of them is an unchanged re-crawl
+        with bookmarks_to_crawl(count, local, domains, delay) as ids:
+            batches = [ids[i : i + batch_size] for i in range(0, len(ids), batch_size)]
+            duration, latencies = measure(method, batches, workers)
+
+        print(
+            f"{name:>12} | {len(ids) / duration:>9.2f} "
+            f"| {statistics.median(latencies):>8.2f}s | {max(latencies):>8.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Compare BeautifulSoup and streaming lxml parsing of netscape bookmark files
+
+Usage:
+    python -m resources.benchmarks.html_parser_benchmark [10000 100000 500000]
+"""
+import io
+import sys
+import time
+import tracemalloc
+
+from App.controllers.bookmark_file_managers import BookmarkHTMLFileManager
+
+
+def synthetic_bookmarks_file(links_count: int, folder_size: int = 500) -> bytes:
+    lines = [
+        "<!DOCTYPE NETSCAPE-Bookmark-file-1>",
+        '<META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=UTF-8">',
+        "<TITLE>Bookmarks</TITLE>",
+        "<H1>Bookmarks</H1>",
+        "<DL><p>",
+    ]
+    for i in range(links_count):
+        if i % folder_size == 0:
+            if i:
+                lines.append("</DL><p>")
+            lines.append(
+                f'<DT><H3 ADD_DATE="1700000000">Folder {i // folder_size}</H3>'
+            )
+            lines.append("<DL><p>")
+        lines.append(
+            f'<DT><A HREF="https://example{i % 97}.com/page/{i}" '
+            f'ADD_DATE="1700000000" ICON="data:image/png;base64,AAAA">Page {i}</A>'
+        )
+    lines.append("</DL><p>")
+    lines.append("</DL><p>")
+    return "\n".join(lines).encode("utf8")
+
+
+def soup_links(manager: BookmarkHTMLFileManager) -> int:
+    # The old `get_links` implementation
+    links = []
+    for item in manager.soup.select("a"):
+        attrs = item.attrs.copy()
+        attrs["url"] = attrs.pop("href")
+        attrs["title"] = item.text
+        attrs["added_at"] = attrs.pop("add_date", None)
+        links.append(attrs)
+    return len(links)
+
+
+def streaming_links(manager: BookmarkHTMLFileManager) -> int:
+    return sum(1 for _ in manager.iter_links())
+
+
+def measure(method, content: bytes) -> tuple[float, float, int]:
+    manager = BookmarkHTMLFileManager(io.BytesIO(content))
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = method(manager)
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return duration, peak / 1024 / 1024, count
+
+
+def main(sizes: list[int]):
+    print(f"{'links':>8} | {'method':>10} | {'seconds':>8} | {'peak MB':>8}")
+    for size in sizes:
+        content = synthetic_bookmarks_file(size)
+        for name, method in [("soup", soup_links), ("streaming", streaming_links)]:
+            duration, peak, count = measure(method, content)
+            assert count == size, f"{name} parsed {count} of {size} links"
+            print(f"{size:>8} | {name:>10} | {duration:>8.2f} | {peak:>8.1f}")
+
+
+if __name__ == "__main__":
+    main([int(i) for i in sys.argv[1:]] or [10_000, 100_000, 500_000])